@@ -0,0 +1,149 @@
+import contextlib
+import datetime
+import glob
+import hashlib
+import json
+import os
+import tempfile
+
+# Bookkeeping for the files we derive from the raw dictionaries in dicts/.
+# Every artifact gets a manifest next to it (e.g. jmdict.idx.manifest.json) recording
+# the size, mtime and hash of each source file, the builder version and any config
+# that affects the build, so we can tell when it needs rebuilding. It also records the size
+# and mtime of the artifact as last verified, so it's only checked again once it changes.
+
+MANIFEST_SUFFIX = ".manifest.json"
+TEMP_SUFFIX = ".tmp"
+
+# check_artifact results
+FRESH = "fresh"                # up to date, use as is
+STALE = "stale"                # sources or build config changed, still loadable while it's rebuilt
+INCOMPATIBLE = "incompatible"  # made by a different builder version, must not be loaded
+MISSING = "missing"            # never built
+LEGACY = "legacy"              # from before manifests, none of its sources to rebuild from, loaded as it is
+
+def manifest_path(artifact_path):
+    return artifact_path + MANIFEST_SUFFIX
+
+def file_hash(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def describe_source(filepath):
+    stat = os.stat(filepath)
+    return {"file": os.path.basename(filepath), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_hash(filepath)}
+
+# An empty temporary file next to filepath, to be written and renamed over it
+def temp_path(filepath):
+    directory, name = os.path.split(os.path.abspath(filepath))
+    handle, path = tempfile.mkstemp(prefix=name + ".", suffix=TEMP_SUFFIX, dir=directory)
+    os.close(handle)
+    return path
+
+def remove_temp(path):
+    with contextlib.suppress(OSError):
+        os.remove(path)
+
+# Temporary files of filepath left behind by a build that never finished, e.g. Anki closing mid rebuild
+def remove_leftover_temps(filepath):
+    directory, name = os.path.split(os.path.abspath(filepath))
+    for path in glob.glob(os.path.join(glob.escape(directory), glob.escape(name + ".") + "*" + TEMP_SUFFIX)):
+        remove_temp(path)
+
+# Writes to a temporary file in the same directory and renames it over the target,
+# so a crash or a reader never sees a half written file
+@contextlib.contextmanager
+def atomic_path(filepath):
+    path = temp_path(filepath)
+    try:
+        yield path
+        os.replace(path, filepath)
+    except BaseException:
+        remove_temp(path)
+        raise
+
+def describe_sources(sources):
+    return [describe_source(source) for source in sources if os.path.isfile(source)]
+
+def describe_artifact(artifact_path):
+    stat = os.stat(artifact_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def save_manifest(artifact_path, manifest):
+    with atomic_path(manifest_path(artifact_path)) as temp_path:
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=2)
+
+# described, when given, is describe_sources(sources) from before the build. A source that
+# changes while the artifact is being built then leaves it stale rather than marked up to date.
+# verified is what the artifact looked like when last verified, by default it's been verified as it is now.
+def write_manifest(artifact_path, sources, builder_version, build_config=None, described=None, verified=None):
+    save_manifest(artifact_path, {
+        "artifact": os.path.basename(artifact_path),
+        "builder_version": builder_version,
+        "build_config": build_config or {},
+        "sources": describe_sources(sources) if described is None else described,
+        "built": datetime.datetime.now().isoformat(timespec='seconds'),
+        "verified": describe_artifact(artifact_path) if verified is None else verified,
+    })
+
+def read_manifest(artifact_path):
+    try:
+        with open(manifest_path(artifact_path), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+# Whether the artifact is still the file that was last verified
+def artifact_verified(artifact_path):
+    manifest = read_manifest(artifact_path)
+    return manifest is not None and manifest.get("verified") == describe_artifact(artifact_path)
+
+# Records the artifact as verified as it is now. A legacy artifact gets a manifest holding just that,
+# marked legacy so it isn't mistaken for one from another builder version.
+def mark_verified(artifact_path):
+    manifest = read_manifest(artifact_path)
+    if manifest is None:
+        manifest = {"artifact": os.path.basename(artifact_path), "legacy": True}
+    manifest["verified"] = describe_artifact(artifact_path)
+    save_manifest(artifact_path, manifest)
+
+# Compares an artifact's manifest against its sources, returns one of the statuses above.
+# Sizes and mtimes are checked first, the source is only hashed again when they differ.
+def check_artifact(artifact_path, sources, builder_version, build_config=None):
+    if not os.path.isfile(artifact_path):
+        return MISSING
+    manifest = read_manifest(artifact_path)
+    # Left by a version from before manifests (or copied in by hand). Rebuilding needs the sources,
+    # without them the file is the only copy of the data so it's kept. Once they're there it's rebuilt.
+    # A source that is itself an artifact (jmdict.idx for the sentences) doesn't hold the data to rebuild from.
+    if (manifest is None or manifest.get("legacy")) and not any(os.path.isfile(source) and not os.path.isfile(manifest_path(source)) for source in sources):
+        return LEGACY
+    if manifest is None or manifest.get("builder_version") != builder_version:
+        return INCOMPATIBLE
+    if manifest.get("build_config", {}) != (build_config or {}):
+        return STALE
+
+    recorded = {source["file"]: source for source in manifest.get("sources", [])}
+    touched = False
+    for source in sources:
+        # A source that has been removed can't be rebuilt from, so keep what we have
+        if not os.path.isfile(source):
+            continue
+        previous = recorded.get(os.path.basename(source))
+        if previous is None:
+            return STALE
+        stat = os.stat(source)
+        if stat.st_size == previous["size"] and stat.st_mtime_ns == previous["mtime_ns"]:
+            continue
+        if stat.st_size != previous["size"] or file_hash(source) != previous["sha256"]:
+            return STALE
+        touched = True
+
+    # Same contents with a new mtime, record it so we don't hash it again next time
+    if touched:
+        write_manifest(artifact_path, sources, builder_version, build_config, verified=manifest.get("verified", {}))
+    return FRESH
@@ -12,11 +12,23 @@ DIR_WANAKANA = "wanakana";
 DIR_DICTIONARIES = "dicts";
 DIR_TEMP_FOLDER = "temp";
 DIR_ICONS = "icons";
+DIR_USER_FILES = "user_files";
 
 FILE_JMDICT_JSON = "JmdictFurigana.json";
+FILE_FURIGANA_INDEX = "furigana.idx";
 FILE_JMDICT_XML = "JMdict_e.xml";
 FILE_JMDICT_PICKLE = "dill.pkl";
 FILE_SENTENCES_PICKLE = "sentences.pickle";
+FILE_JMDICT_INDEX = "jmdict.idx";
+FILE_SENTENCES_DATA = "sentences.dat";
+FILE_SENTENCES_DB = "sentences.db";
+FILE_LOAD_TIMINGS_LOG = "load_timings.log";
+
+# Names of the background data loads
+DATA_FURIGANA = "furigana";
+DATA_JMDICT = "jmdict";
+DATA_SENTENCES = "sentences";
+DATA_KNOWN_WORDS = "known_words";
 
 ANKIWEB_ADDON_ID = "1727436922"; # FIX THIS
 
@@ -33,9 +45,15 @@ TITLE_PREFIX = ADDON_NAME + ': '
 GUI_BROWSER_SETTINGS_DIALOG_TITLE = "Settings";
 GUI_BROWSER_BATCH_DIALOG_TITLE = "Batch Update";
 GUI_BROWSER_SELECTED_BATCH_DIALOG_TITLE = "Batch Update Selected Items";
+GUI_BROWSER_DIAGNOSTICS_DIALOG_TITLE = "Load Diagnostics";
 
 GUI_SETTINGS_DIALOG_TITLE = TITLE_PREFIX + GUI_BROWSER_SETTINGS_DIALOG_TITLE;
 GUI_BATCH_DIALOG_TITLE = TITLE_PREFIX + GUI_BROWSER_BATCH_DIALOG_TITLE;
+GUI_DIAGNOSTICS_DIALOG_TITLE = TITLE_PREFIX + GUI_BROWSER_DIAGNOSTICS_DIALOG_TITLE;
+GUI_STILL_LOADING = TITLE_PREFIX + "Dictionary still loading...";
+GUI_SENTENCES_STILL_LOADING = TITLE_PREFIX + "Example sentences still loading, they'll be added next time.";
+GUI_LOAD_FAILED = TITLE_PREFIX + "Couldn't load {name}: {error}";
+GUI_SUGGESTION_TOOLTIP_MS = 4000; # how long editor suggestions stay up
 
 # SETTINGS
 
@@ -61,6 +79,12 @@ SETTING_NUM_DEFS = "number_of_defs";
 SETTING_NUM_SENTENCES = "number_of_sentences";
 SETTING_SENTENCE_DEST_FIELD = "sentence_field";
 SETTING_AUDIO_DEST_FIELD = "audio_field";
+SETTING_BUILD_WORKERS = "build_workers";
+SETTING_NUM_SUGGESTIONS = "number_of_suggestions";
+SETTING_SENTENCE_RANKING = "sentence_ranking";
+SETTING_SENTENCE_TRANSLATIONS = "sentence_translations";
+SETTING_SENTENCE_ENGINE = "sentence_engine";
+SETTING_PREFER_KNOWN_WORDS = "prefer_known_words";
 
 # ICONS
 ICON_CLEAR = "icons8-clear-50.png";
\ No newline at end of file
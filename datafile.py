@@ -0,0 +1,172 @@
+import mmap
+import struct
+import sys
+import zlib
+
+# Versioned binary container used for the prebuilt data files in dicts/, in place of pickles.
+# Layout:
+#   header    magic (4 bytes), format version, data version, section count,
+#             CRC-32 of the directory (uint32 each), byte order (1 byte, 1 = little endian), padding
+#   directory one (name: 16 bytes, offset: uint64, length: uint64, item type: 4 bytes,
+#             CRC-32 of the data: uint32) per section
+#   sections  raw section data, each one starting on an 8 byte boundary
+# Sections are fixed width arrays (item type being an array typecode, e.g. 'I' for uint32) or
+# 'B' for plain bytes, such as a table of UTF-8 strings indexed by an offsets array.
+# The format version covers this layout, the data version what the writer put in the sections.
+# Files are opened with mmap and sections handed out as memoryviews, so nothing is copied.
+MAGIC = b'AJDF'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<4sIIIIB3x')
+DIRECTORY_ENTRY = struct.Struct('<16sQQ4sI')
+ALIGNMENT = 8
+COPY_CHUNK = 1 << 20
+LITTLE_ENDIAN = 1 if sys.byteorder == 'little' else 0
+
+class DataFileError(Exception):
+    pass
+
+def _padding(position):
+    return (ALIGNMENT - position % ALIGNMENT) % ALIGNMENT
+
+def _section_length(data):
+    if hasattr(data, 'seek'):
+        length = data.seek(0, 2)
+        data.seek(0)
+        return length
+    return memoryview(data).nbytes
+
+# Item type of a section: an array's typecode, 'B' for bytes and files
+def _section_type(data):
+    if hasattr(data, 'read'):
+        return 'B'
+    if hasattr(data, 'typecode'):
+        return data.typecode
+    return memoryview(data).format.lstrip('@=<>!')
+
+# Writes a data file. sections maps section name to either a bytes-like object
+# (bytes, array, memoryview) or a binary file object that is copied from the start.
+# The directory goes in last, once the checksums of the sections are known.
+def write_datafile(filepath, version, sections):
+    names = list(sections)
+    for name in names:
+        if len(name.encode('ascii')) > 16:
+            raise DataFileError(f"section name {name!r} is longer than 16 bytes")
+    lengths = [_section_length(sections[name]) for name in names]
+    position = HEADER.size + DIRECTORY_ENTRY.size * len(names)
+    offsets = []
+    for length in lengths:
+        position += _padding(position)
+        offsets.append(position)
+        position += length
+
+    with open(filepath, 'wb') as file:
+        file.write(b'\0' * (HEADER.size + DIRECTORY_ENTRY.size * len(names)))
+        checksums = []
+        for name, offset in zip(names, offsets):
+            file.write(b'\0' * (offset - file.tell()))
+            data = sections[name]
+            checksum = 0
+            if hasattr(data, 'read'):
+                for chunk in iter(lambda: data.read(COPY_CHUNK), b''):
+                    checksum = zlib.crc32(chunk, checksum)
+                    file.write(chunk)
+            else:
+                view = memoryview(data).cast('B')
+                checksum = zlib.crc32(view)
+                file.write(view)
+            checksums.append(checksum)
+
+        directory = b''.join(DIRECTORY_ENTRY.pack(name.encode('ascii'), offset, length, _section_type(sections[name]).encode('ascii'), checksum)
+                             for name, offset, length, checksum in zip(names, offsets, lengths, checksums))
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, version, len(names), zlib.crc32(directory), LITTLE_ENDIAN))
+        file.write(directory)
+
+# Sections that haven't been written out yet, read the same way as a DataFile's
+class MemorySections:
+    def __init__(self, sections):
+        self.sections = sections
+
+    def __contains__(self, name):
+        return name in self.sections
+
+    def section(self, name):
+        return memoryview(self.sections[name]).cast('B')
+
+    def array(self, name, typecode):
+        return self.section(name).cast(typecode)
+
+# Opening only checks the header and directory, sections are paged in as they're read.
+# With verify, every section is also checked against its checksum, which reads the whole file.
+class DataFile:
+    def __init__(self, filepath, verify=False):
+        self.filepath = filepath
+        self.file = open(filepath, 'rb')
+        try:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise DataFileError(f"{filepath} is empty")
+        self.view = memoryview(self.mmap)
+        self.sections = {}
+        try:
+            self.read_directory(verify)
+        except struct.error:
+            self.close()
+            raise DataFileError(f"{filepath} is truncated")
+        except DataFileError:
+            self.close()
+            raise
+
+    def read_directory(self, verify):
+        magic, format_version, self.version, count, directory_checksum, little_endian = HEADER.unpack_from(self.view, 0)
+        if magic != MAGIC:
+            raise DataFileError(f"{self.filepath} is not a data file")
+        if format_version != FORMAT_VERSION:
+            raise DataFileError(f"{self.filepath} is data file format {format_version}, expected {FORMAT_VERSION}")
+        if little_endian != LITTLE_ENDIAN:
+            raise DataFileError(f"{self.filepath} was written on a machine with the other byte order")
+        with self.view[HEADER.size:HEADER.size + count * DIRECTORY_ENTRY.size] as directory:
+            if len(directory) != count * DIRECTORY_ENTRY.size or zlib.crc32(directory) != directory_checksum:
+                raise DataFileError(f"{self.filepath} has a damaged directory")
+            for i in range(count):
+                name, offset, length, item_type, checksum = DIRECTORY_ENTRY.unpack_from(directory, i * DIRECTORY_ENTRY.size)
+                name = name.rstrip(b'\0').decode('ascii')
+                if offset + length > len(self.view):
+                    raise DataFileError(f"{self.filepath} is truncated")
+                if verify and zlib.crc32(self.view[offset:offset + length]) != checksum:
+                    raise DataFileError(f"{self.filepath} is damaged, section {name} doesn't match its checksum")
+                self.sections[name] = (offset, length, item_type.rstrip(b'\0').decode('ascii'))
+
+    def __contains__(self, name):
+        return name in self.sections
+
+    def section(self, name):
+        offset, length, _ = self.sections[name]
+        return self.view[offset:offset + length]
+
+    # Section viewed as an array of fixed width items, e.g. 'I' for uint32.
+    # typecode has to be the type the section was written with.
+    def array(self, name, typecode):
+        item_type = self.sections[name][2]
+        if item_type != typecode:
+            raise DataFileError(f"{self.filepath}: section {name} holds {item_type!r} items, not {typecode!r}")
+        return self.section(name).cast(typecode)
+
+    def close(self):
+        self.sections = {}
+        if getattr(self, 'view', None) is not None:
+            self.view.release()
+            self.view = None
+        if getattr(self, 'mmap', None) is not None:
+            self.mmap.close()
+            self.mmap = None
+        self.file.close()
+
+# Checks every section of a data file against its checksum. The loads do this once after a build
+# and again only if the file has changed since, other files (the SQLite sentence database) are left alone.
+def verify(filepath):
+    with open(filepath, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            return
+    DataFile(filepath, verify=True).close()
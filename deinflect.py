@@ -0,0 +1,297 @@
+import collections
+import functools
+
+from . import jmdict_index
+from . import wanakana
+
+# Turns conjugated words back into dictionary forms, e.g. 食べました -> 食べる, 高くなかった -> 高い.
+# The rules below are compiled into a trie keyed on the reversed inflected suffix, so finding
+# the rules that apply to a word walks at most len(word) nodes however many rules there are.
+# Rules are applied repeatedly (食べられなかった -> 食べられない -> 食べられる -> 食べる) and
+# every candidate is checked with one hash lookup in the JMdict index.
+
+# Word types. The dictionary form types are the JMdict POS flags, so a candidate matches an
+# entry when they share a bit. The rest are intermediate forms that only chain into other rules.
+TYPE_ICHIDAN = jmdict_index.POS_ICHIDAN
+TYPE_GODAN = jmdict_index.POS_GODAN
+TYPE_SURU = jmdict_index.POS_SURU
+TYPE_KURU = jmdict_index.POS_KURU
+TYPE_I_ADJECTIVE = jmdict_index.POS_I_ADJECTIVE
+TYPE_MASU = 1 << 16
+TYPE_TE = 1 << 17
+
+DICTIONARY_TYPES = TYPE_ICHIDAN | TYPE_GODAN | TYPE_SURU | TYPE_KURU | TYPE_I_ADJECTIVE
+
+# Chains longer than this are never real Japanese and only cost time
+MAX_DEPTH = 8
+
+# Godan dictionary endings with their a, i, u, e, o row kana and te form
+GODAN_ROWS = {
+    'う': ('わいうえお', 'って'),
+    'く': ('かきくけこ', 'いて'),
+    'ぐ': ('がぎぐげご', 'いで'),
+    'す': ('さしすせそ', 'して'),
+    'つ': ('たちつてと', 'って'),
+    'ぬ': ('なにぬねの', 'んで'),
+    'ぶ': ('ばびぶべぼ', 'んで'),
+    'む': ('まみむめも', 'んで'),
+    'る': ('らりるれろ', 'って'),
+}
+
+# (inflected suffix, dictionary suffix, type of the inflected form, type of the result, reason)
+# The type of the inflected form decides what a rule can follow: a rule only applies to the
+# original word (where any type goes) or to the result of a rule that produced one of its types.
+# 0 means the form can't be conjugated any further, so the rule only applies to the original word.
+RULES = [
+    # Polite forms back to ます
+    ("ました", "ます", 0, TYPE_MASU, "polite past"),
+    ("ません", "ます", 0, TYPE_MASU, "polite negative"),
+    ("ませんでした", "ます", 0, TYPE_MASU, "polite past negative"),
+    ("ましょう", "ます", 0, TYPE_MASU, "polite volitional"),
+    ("まして", "ます", 0, TYPE_MASU, "polite te form"),
+    # Auxiliaries on the te form
+    ("ている", "て", TYPE_ICHIDAN, TYPE_TE, "progressive"),
+    ("でいる", "で", TYPE_ICHIDAN, TYPE_TE, "progressive"),
+    ("てる", "て", TYPE_ICHIDAN, TYPE_TE, "progressive"),
+    ("でる", "で", TYPE_ICHIDAN, TYPE_TE, "progressive"),
+    ("てある", "て", TYPE_GODAN, TYPE_TE, "resultative"),
+    ("である", "で", TYPE_GODAN, TYPE_TE, "resultative"),
+    ("ておく", "て", TYPE_GODAN, TYPE_TE, "in advance"),
+    ("でおく", "で", TYPE_GODAN, TYPE_TE, "in advance"),
+    ("てしまう", "て", TYPE_GODAN, TYPE_TE, "completion"),
+    ("でしまう", "で", TYPE_GODAN, TYPE_TE, "completion"),
+    ("ちゃう", "て", TYPE_GODAN, TYPE_TE, "completion"),
+    ("じゃう", "で", TYPE_GODAN, TYPE_TE, "completion"),
+    ("てください", "て", 0, TYPE_TE, "request"),
+    ("でください", "で", 0, TYPE_TE, "request"),
+    # い-adjectives, also used by the ない and たい forms of verbs which conjugate the same way
+    ("くない", "い", TYPE_I_ADJECTIVE, TYPE_I_ADJECTIVE, "negative"),
+    ("かった", "い", 0, TYPE_I_ADJECTIVE, "past"),
+    ("くて", "い", TYPE_TE, TYPE_I_ADJECTIVE, "te form"),
+    ("ければ", "い", 0, TYPE_I_ADJECTIVE, "conditional"),
+    ("かったら", "い", 0, TYPE_I_ADJECTIVE, "conditional"),
+    ("く", "い", 0, TYPE_I_ADJECTIVE, "adverbial"),
+    ("さ", "い", 0, TYPE_I_ADJECTIVE, "noun form"),
+    ("そう", "い", 0, TYPE_I_ADJECTIVE, "seemingness"),
+    ("すぎる", "い", TYPE_ICHIDAN, TYPE_I_ADJECTIVE, "excess"),
+    ("よくない", "いい", TYPE_I_ADJECTIVE, TYPE_I_ADJECTIVE, "negative"),
+    ("よかった", "いい", 0, TYPE_I_ADJECTIVE, "past"),
+    ("よくて", "いい", TYPE_TE, TYPE_I_ADJECTIVE, "te form"),
+    ("よければ", "いい", 0, TYPE_I_ADJECTIVE, "conditional"),
+]
+
+# Endings added to the stem of a verb, with the type of the form they make.
+# Ichidan endings replace the final る. Godan endings start with the kana of the dictionary
+# ending's row picked by the first item (0 = a row, 1 = i row, ...) or its te or ta form.
+ICHIDAN_ENDINGS = [
+    ("ない", TYPE_I_ADJECTIVE, "negative"),
+    ("ます", TYPE_MASU, "polite"),
+    ("た", 0, "past"),
+    ("て", TYPE_TE, "te form"),
+    ("たい", TYPE_I_ADJECTIVE, "desire"),
+    ("たら", 0, "conditional"),
+    ("たり", 0, "representative"),
+    ("れば", 0, "conditional"),
+    ("よう", 0, "volitional"),
+    ("ろ", 0, "imperative"),
+    ("なさい", 0, "polite imperative"),
+    ("ず", 0, "negative"),
+    ("られる", TYPE_ICHIDAN, "potential or passive"),
+    ("れる", TYPE_ICHIDAN, "potential"),
+    ("させる", TYPE_ICHIDAN, "causative"),
+]
+
+GODAN_ENDINGS = [
+    (0, "ない", TYPE_I_ADJECTIVE, "negative"),
+    (1, "ます", TYPE_MASU, "polite"),
+    ("te", "", TYPE_TE, "te form"),
+    ("ta", "", 0, "past"),
+    ("ta", "ら", 0, "conditional"),
+    ("ta", "り", 0, "representative"),
+    (1, "たい", TYPE_I_ADJECTIVE, "desire"),
+    (1, "なさい", 0, "polite imperative"),
+    (3, "ば", 0, "conditional"),
+    (4, "う", 0, "volitional"),
+    (3, "", 0, "imperative"),
+    (0, "ず", 0, "negative"),
+    (3, "る", TYPE_ICHIDAN, "potential"),
+    (0, "れる", TYPE_ICHIDAN, "passive"),
+    (0, "せる", TYPE_ICHIDAN, "causative"),
+]
+
+# する and 来る, stem included, for the verb on its own and for suru nouns (勉強します)
+SURU_FORMS = [
+    ("しない", TYPE_I_ADJECTIVE, "negative"),
+    ("します", TYPE_MASU, "polite"),
+    ("した", 0, "past"),
+    ("して", TYPE_TE, "te form"),
+    ("したい", TYPE_I_ADJECTIVE, "desire"),
+    ("したら", 0, "conditional"),
+    ("すれば", 0, "conditional"),
+    ("しよう", 0, "volitional"),
+    ("しろ", 0, "imperative"),
+    ("せよ", 0, "imperative"),
+    ("しなさい", 0, "polite imperative"),
+    ("せず", 0, "negative"),
+    ("される", TYPE_ICHIDAN, "passive"),
+    ("させる", TYPE_ICHIDAN, "causative"),
+]
+
+KURU_FORMS = [
+    ("こない", TYPE_I_ADJECTIVE, "negative"),
+    ("きます", TYPE_MASU, "polite"),
+    ("きた", 0, "past"),
+    ("きて", TYPE_TE, "te form"),
+    ("きたい", TYPE_I_ADJECTIVE, "desire"),
+    ("きたら", 0, "conditional"),
+    ("くれば", 0, "conditional"),
+    ("こよう", 0, "volitional"),
+    ("こい", 0, "imperative"),
+    ("きなさい", 0, "polite imperative"),
+    ("こられる", TYPE_ICHIDAN, "potential or passive"),
+    ("これる", TYPE_ICHIDAN, "potential"),
+    ("こさせる", TYPE_ICHIDAN, "causative"),
+]
+
+# Expands the ending tables into RULES entries
+def _verb_rules():
+    rules = []
+    for ending, in_type, reason in ICHIDAN_ENDINGS:
+        rules.append((ending, "る", in_type, TYPE_ICHIDAN, reason))
+    for dictionary_ending, (row, te) in GODAN_ROWS.items():
+        for stem, ending, in_type, reason in GODAN_ENDINGS:
+            if stem == "te":
+                inflected = te + ending
+            elif stem == "ta":
+                inflected = te[0] + ("だ" if te[1] == "で" else "た") + ending
+            else:
+                inflected = row[stem] + ending
+            rules.append((inflected, dictionary_ending, in_type, TYPE_GODAN, reason))
+    # 行く is the one godan verb with an irregular te form
+    for iku in ("行", "い"):
+        rules.append((iku + "って", iku + "く", TYPE_TE, TYPE_GODAN, "te form"))
+        rules.append((iku + "った", iku + "く", 0, TYPE_GODAN, "past"))
+    for inflected, in_type, reason in SURU_FORMS:
+        rules.append((inflected, "する", in_type, TYPE_SURU, reason))
+    for inflected, in_type, reason in KURU_FORMS:
+        rules.append((inflected, "くる", in_type, TYPE_KURU, reason))
+        rules.append(("来" + inflected[1:], "来る", in_type, TYPE_KURU, reason))
+    return rules
+
+RULES.extend(_verb_rules())
+
+# One possible dictionary form of a word.
+# term: the candidate, types: the word types it could be (0 for the word as given),
+# reasons: the conjugations undone to get there, outermost first
+class Deinflection:
+    __slots__ = ("term", "types", "reasons")
+
+    def __init__(self, term, types=0, reasons=()):
+        self.term = term
+        self.types = types
+        self.reasons = reasons
+
+    def __repr__(self):
+        return f"Deinflection({self.term!r}, {self.types!r}, {self.reasons!r})"
+
+    # Whether a dictionary entry can be this candidate's dictionary form
+    def matches(self, entry):
+        return self.types == 0 or bool(entry.pos_flags & self.types & DICTIONARY_TYPES)
+
+# A candidate that was found in the dictionary
+class DeinflectedMatch:
+    __slots__ = ("term", "entry", "reasons")
+
+    def __init__(self, term, entry, reasons):
+        self.term = term
+        self.entry = entry
+        self.reasons = reasons
+
+    def __repr__(self):
+        return f"DeinflectedMatch({self.term!r}, {self.entry!r}, {self.reasons!r})"
+
+class Deinflector:
+    def __init__(self, rules=RULES):
+        # Trie nodes are dicts from character to child node, the rules that end at a node
+        # are kept under the empty string
+        self.trie = {}
+        for rule in rules:
+            node = self.trie
+            for char in reversed(rule[0]):
+                node = node.setdefault(char, {})
+            node.setdefault('', []).append(rule)
+
+    # The rules whose inflected suffix the word ends with, shortest suffix first
+    def matching_rules(self, word):
+        node = self.trie
+        for char in reversed(word):
+            node = node.get(char)
+            if node is None:
+                return
+            yield from node.get('', ())
+
+    # Every candidate dictionary form of word, starting with the word itself.
+    # Breadth first, so candidates needing fewer steps come first.
+    def deinflect(self, word):
+        results = [Deinflection(word)]
+        seen = {(word, 0)}
+        queue = collections.deque(results)
+        while queue:
+            current = queue.popleft()
+            if len(current.reasons) >= MAX_DEPTH:
+                continue
+            for inflected, base, in_type, out_type, reason in self.matching_rules(current.term):
+                if current.types and not current.types & in_type:
+                    continue
+                term = current.term[:len(current.term) - len(inflected)] + base
+                if not term or (term, out_type) in seen:
+                    continue
+                seen.add((term, out_type))
+                candidate = Deinflection(term, out_type, (reason,) + current.reasons)
+                results.append(candidate)
+                queue.append(candidate)
+        return results
+
+    # The dictionary entries word could be an inflection of, best guess first.
+    # index is a JMdictIndex, kana candidates are also looked up by reading.
+    def lookup(self, index, word):
+        return self.match(index, self.deinflect(word))
+
+    def match(self, index, candidates):
+        matches = []
+        for candidate in candidates:
+            for term, entry in self.entries_for(index, candidate):
+                if candidate.matches(entry):
+                    matches.append(DeinflectedMatch(term, entry, candidate.reasons))
+        return matches
+
+    def entries_for(self, index, candidate):
+        for entry in index.entries(candidate.term):
+            yield candidate.term, entry
+        if wanakana.is_kana(candidate.term):
+            for entry in index.lookup_reading(candidate.term):
+                yield candidate.term, entry
+        # Suru nouns are in the dictionary without the する
+        if candidate.types & TYPE_SURU and candidate.term.endswith("する") and len(candidate.term) > 2:
+            noun = candidate.term[:-2]
+            for entry in index.entries(noun):
+                if entry.has_pos(jmdict_index.POS_SURU):
+                    yield noun, entry
+
+_deinflector = Deinflector()
+
+# Standalone API, e.g. for batch jobs. The candidates only depend on the word, so they're cached.
+@functools.lru_cache(maxsize=4096)
+def _candidates(word):
+    return tuple(_deinflector.deinflect(word))
+
+def deinflect(word):
+    return list(_candidates(word))
+
+def lookup(index, word):
+    return _deinflector.match(index, _candidates(word))
+
+# The best match for a conjugated word, None when nothing in the dictionary fits
+def find_dictionary_form(index, word):
+    matches = lookup(index, word)
+    return matches[0] if matches else None
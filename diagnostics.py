@@ -0,0 +1,155 @@
+import contextlib
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+
+from . import constants
+
+# Timing for the add-on's load phases (dictionary loads, index builds, sentence library, menus).
+# Each phase records wall time, the change in resident memory and how many items it loaded.
+# Records are kept for the diagnostics dialog and written as JSON lines to a log file.
+
+# Current resident set size in bytes, None when it can't be determined.
+# On macOS only the peak is available without extra dependencies, so that's used instead.
+def current_rss():
+    try:
+        if sys.platform.startswith("linux"):
+            with open("/proc/self/statm", "r") as file:
+                return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD),
+                            ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t),
+                            ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t),
+                            ("PeakPagefileUsage", ctypes.c_size_t)]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+            return None
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except Exception:
+        return None
+
+class LoadPhase:
+    def __init__(self, name):
+        self.name = name
+        self.items = None
+        self.seconds = None
+        self.rss_before = None
+        self.rss_after = None
+        self.error = None
+        self.thread = threading.current_thread().name
+        self.started = None
+
+    @property
+    def rss_delta(self):
+        if self.rss_before is None or self.rss_after is None:
+            return None
+        return self.rss_after - self.rss_before
+
+    # Throughput, for phases that set items
+    @property
+    def items_per_second(self):
+        if self.items is None or not self.seconds:
+            return None
+        return self.items / self.seconds
+
+    def as_dict(self):
+        return {"phase": self.name,
+                "seconds": round(self.seconds, 4) if self.seconds is not None else None,
+                "rss_mb": round(self.rss_after / 2**20, 1) if self.rss_after is not None else None,
+                "rss_delta_mb": round(self.rss_delta / 2**20, 1) if self.rss_delta is not None else None,
+                "items": self.items,
+                "items_per_s": round(self.items_per_second) if self.items_per_second is not None else None,
+                "thread": self.thread,
+                "error": self.error}
+
+class LoadTimings:
+    def __init__(self, logger_name):
+        self.phases = []
+        self.lock = threading.Lock()
+        self.session = datetime.datetime.now().isoformat(timespec='seconds')
+        self.log_file = None
+        self.logger = logging.getLogger(logger_name)
+        self.logger.propagate = False
+
+    # Sends records to a JSON lines file, kept to about a megabyte
+    def set_log_file(self, filepath):
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(filepath, maxBytes=1 << 20, backupCount=1, encoding='utf-8', delay=True)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        for old in list(self.logger.handlers):
+            self.logger.removeHandler(old)
+            old.close()
+        self.logger.addHandler(handler)
+        self.logger.setLevel(logging.INFO)
+        self.log_file = filepath
+
+    # Times the block, set .items on the yielded phase to record how much was loaded:
+    #     with timings.phase("jmdict: load") as phase:
+    #         index = ...
+    #         phase.items = len(index)
+    @contextlib.contextmanager
+    def phase(self, name):
+        phase = self.begin(name)
+        try:
+            yield phase
+        except BaseException as inst:
+            phase.error = repr(inst)
+            raise
+        finally:
+            self.end(phase)
+
+    # begin()/end() for phases that can't be wrapped in a with block, e.g. the module import
+    def begin(self, name):
+        phase = LoadPhase(name)
+        phase.rss_before = current_rss()
+        phase.started = time.perf_counter()
+        return phase
+
+    def end(self, phase):
+        phase.seconds = time.perf_counter() - phase.started
+        phase.rss_after = current_rss()
+        self.record(phase)
+
+    def record(self, phase):
+        with self.lock:
+            self.phases.append(phase)
+        self.logger.info(json.dumps(dict(session=self.session, **phase.as_dict()), ensure_ascii=False))
+
+    # Plain text table of this session's phases for the diagnostics dialog
+    def summary(self):
+        with self.lock:
+            phases = list(self.phases)
+        lines = [f"Session started {self.session}", "",
+                 f"{'Phase':<36}{'Seconds':>10}{'RSS MB':>10}{'Δ MB':>10}{'Items':>10}"]
+        for phase in phases:
+            info = phase.as_dict()
+            lines.append(f"{phase.name:<36}"
+                         f"{info['seconds'] if info['seconds'] is not None else '-':>10}"
+                         f"{info['rss_mb'] if info['rss_mb'] is not None else '-':>10}"
+                         f"{info['rss_delta_mb'] if info['rss_delta_mb'] is not None else '-':>10}"
+                         f"{info['items'] if info['items'] is not None else '-':>10}"
+                         + (f"  FAILED: {phase.error}" if phase.error else ""))
+        return "\n".join(lines)
+
+# Shared by kanji_furi and sentence_examples
+load_timings = LoadTimings(constants.LOGGER_NAME + ".timings")
@@ -0,0 +1,120 @@
+import json
+from array import array
+
+from . import datafile
+from . import jmdict_index
+
+# Bump when the saved index format changes so existing files get rebuilt
+INDEX_VERSION = 3
+
+# "text [tab] reading" is the key of a homograph's rendering
+READING_SEPARATOR = "\t"
+
+# Turns a JmdictFurigana segment list into the bracket format used by Anki's furigana filter
+# e.g. [{"ruby": "食", "rt": "た"}, {"ruby": "べる"}] -> 食[た]べる
+def render_furigana(furigana):
+    result = ""
+    last_no_kanji = False
+    for fu in furigana:
+        if "rt" in fu:
+            if last_no_kanji:
+                result += " "
+            result += fu['ruby']
+            result += "[" + fu['rt'] + "]"
+        else:
+            result += fu['ruby']
+            last_no_kanji = True
+    return result
+
+# Hash index over JmdictFurigana holding the ready-to-use bracket strings.
+# by_text keeps the first rendering seen for a word (same as the old linear scan),
+# by_reading only holds homographs whose rendering differs from that one.
+# Built into dicts, saved as a data file with a key table for each (pointing at a table of the
+# distinct renderings) and looked up straight from the mapped file once loaded.
+class FuriganaIndex:
+    def __init__(self):
+        self.by_text = {}
+        self.by_reading = {}
+        self.data = None
+
+    def __len__(self):
+        if self.data is not None:
+            return len(self.text_table)
+        return len(self.by_text)
+
+    def add(self, text, reading, rendered):
+        if text not in self.by_text:
+            self.by_text[text] = rendered
+        elif self.by_text[text] != rendered:
+            self.by_reading.setdefault((text, reading), rendered)
+
+    def lookup(self, text, reading=None):
+        if self.data is not None:
+            if reading:
+                rendered = self.find(self.reading_table, text + READING_SEPARATOR + reading)
+                if rendered is not None:
+                    return rendered
+            return self.find(self.text_table, text) or ""
+        if reading:
+            rendered = self.by_reading.get((text, reading))
+            if rendered is not None:
+                return rendered
+        return self.by_text.get(text, "")
+
+    # Rendering the key points at in a loaded table, None when it isn't there
+    def find(self, table, key):
+        position = table.find(key)
+        if position < 0:
+            return None
+        string_id = table.records(position)[0]
+        return bytes(self.strings[self.string_offsets[string_id]:self.string_offsets[string_id + 1]]).decode('utf-8')
+
+    def build_from_json(self, filepath):
+        with open(filepath, 'r', encoding='utf-8-sig') as file:
+            data = json.load(file)
+        for obj in data:
+            self.add(obj['text'], obj.get('reading', ""), render_furigana(obj['furigana']))
+
+    def save(self, filepath):
+        string_ids = {}
+        string_offsets = array('I', [0])
+        strings = bytearray()
+        def string_id(rendered):
+            if rendered not in string_ids:
+                string_ids[rendered] = len(string_ids)
+                strings.extend(rendered.encode('utf-8'))
+                string_offsets.append(len(strings))
+            return string_ids[rendered]
+        text_table = jmdict_index.KeyTableWriter(ranked=False)
+        for text, rendered in self.by_text.items():
+            text_table.add(text, string_id(rendered))
+        reading_table = jmdict_index.KeyTableWriter(ranked=False)
+        for (text, reading), rendered in self.by_reading.items():
+            reading_table.add(text + READING_SEPARATOR + reading, string_id(rendered))
+        datafile.write_datafile(filepath, INDEX_VERSION, {
+            **text_table.sections("text"),
+            **reading_table.sections("reading"),
+            "string_offsets": string_offsets,
+            "strings": strings,
+        })
+
+    def load(self, filepath):
+        data = datafile.DataFile(filepath)
+        if data.version != INDEX_VERSION:
+            version = data.version
+            data.close()
+            raise datafile.DataFileError(f"{filepath} is index version {version}, expected {INDEX_VERSION}")
+        self.data = data
+        self.text_table = jmdict_index.KeyTable(data, "text")
+        self.reading_table = jmdict_index.KeyTable(data, "reading")
+        self.string_offsets = data.array("string_offsets", 'I')
+        self.strings = data.section("strings")
+
+    def close(self):
+        if self.data is not None:
+            self.text_table.release()
+            self.reading_table.release()
+            self.string_offsets.release()
+            self.strings.release()
+            self.data.close()
+            self.data = None
@@ -0,0 +1,179 @@
+import collections
+import concurrent.futures
+import multiprocessing
+import os
+import re
+import sys
+import xml.etree.ElementTree as Et
+
+from . import jmdict_index
+
+# Builds the JMdict index straight from JMdict_e.xml with iterparse.
+# Each <entry> is turned into an index record and cleared as soon as it ends,
+# so memory stays bounded no matter how big the XML file is.
+
+ENTITY_PATTERN = re.compile(r'<!ENTITY\s+(\S+)\s+"([^"]*)"\s*>')
+
+# How many entries between progress reports
+PROGRESS_INTERVAL = 10000
+
+# Entries handed to a worker process at a time in a parallel build
+CHUNK_ENTRIES = 5000
+
+# Reads the <!ENTITY> declarations (the POS codes) from the internal DTD at the top of the file.
+# ElementTree has no docinfo, so we keep our own table.
+def read_entities(filepath):
+    entities = {}
+    with open(filepath, 'r', encoding='utf-8') as file:
+        for line in file:
+            match = ENTITY_PATTERN.search(line)
+            if match:
+                entities[match.group(1)] = match.group(2)
+            elif line.startswith(']>') or line.startswith('<JMdict>'):
+                break
+    return entities
+
+# expat normally expands the entities itself, this catches any code left as "&n;"
+def resolve_entity(text, entities):
+    if text and text.startswith('&') and text.endswith(';'):
+        return entities.get(text[1:-1], text)
+    return text
+
+# Returns (headwords, readings, JMdictEntry) for one <entry> element.
+# headwords are the kebs (or the first reb when there are none) and readings every reb,
+# both as (text, priority rank) lists in document order
+def parse_entry(entry, entities=None):
+    entities = entities or {}
+    headwords = [(k_ele.findtext('keb'), jmdict_index.priority_rank([pri.text for pri in k_ele.findall('ke_pri')]))
+                 for k_ele in entry.findall('k_ele')]
+    readings = []
+    restricted_readings = []
+    for r_ele in entry.findall('r_ele'):
+        reb = r_ele.findtext('reb').strip()
+        readings.append((reb, jmdict_index.priority_rank([pri.text for pri in r_ele.findall('re_pri')])))
+        restricted_readings.append((reb, tuple(restr.text for restr in r_ele.findall('re_restr'))))
+    parts_of_speech_values = [resolve_entity(pos.text, entities) for pos in entry.findall('sense/pos')]
+    senses = tuple(tuple(gloss.text for gloss in sense.iter('gloss')) for sense in entry.iter('sense'))
+    if len(headwords) == 0:
+        headwords.append(readings[0])
+    # dict.fromkeys drops duplicates but keeps document order, so builds are reproducible
+    return (unique_texts(headwords), unique_texts(readings),
+            jmdict_index.JMdictEntry(readings[0][0], tuple(dict.fromkeys(parts_of_speech_values)), senses,
+                                     keb=headwords[0][0], readings=tuple(dict.fromkeys(restricted_readings))))
+
+# Drops repeated texts from a (text, rank) list, keeping the first one
+def unique_texts(items):
+    seen = set()
+    unique = []
+    for text, rank in items:
+        if text not in seen:
+            seen.add(text)
+            unique.append((text, rank))
+    return unique
+
+# Yields parse_entry results for every <entry> in the file.
+# progress is called with (entries done, fraction of the file read).
+def iter_entries(filepath, entities=None, progress=None):
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as file:
+        context = Et.iterparse(file, events=('start', 'end'))
+        _, root = next(context)
+        count = 0
+        for event, elem in context:
+            if event != 'end' or elem.tag != 'entry':
+                continue
+            yield parse_entry(elem, entities)
+            # Drop the finished entry from the tree so it can be freed
+            root.clear()
+            count += 1
+            if progress and count % PROGRESS_INTERVAL == 0:
+                progress(count, file.tell() / size if size else 1.0)
+        if progress:
+            progress(count, 1.0)
+
+# Streams JMdict_e.xml into an index file, returns the number of headwords written.
+# With workers > 1 the entries are parsed in a process pool, see build_index_parallel.
+def build_index(xml_path, index_path, progress=None, workers=1):
+    context = parallel_context() if workers > 1 else None
+    if context is None:
+        return build_index_serial(xml_path, index_path, progress)
+    return build_index_parallel(xml_path, index_path, progress, workers, context)
+
+def build_index_serial(xml_path, index_path, progress=None):
+    entities = read_entities(xml_path)
+    writer = jmdict_index.IndexWriter(index_path)
+    for headwords, readings, entry in iter_entries(xml_path, entities, progress):
+        writer.add(entry, headwords, readings)
+    writer.finish()
+    return len(writer)
+
+# Worker processes need to import this module without going through the add-on's
+# __init__ (which pulls in aqt), so only a forked child, which inherits the already
+# imported modules, can be used. Elsewhere (Windows, macOS) we build serially.
+# Forking a process that has other threads running (Anki's) can deadlock the child,
+# so callers only ask for workers when the user has opted in.
+def parallel_context():
+    if sys.platform == "darwin" or "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context("fork")
+
+# Splits the raw XML into chunks of whole <entry> elements without parsing it.
+# Yields (prolog, chunk, fraction of the file read), the prolog being everything before
+# the root <JMdict> tag, i.e. the XML declaration and the DTD with the entities.
+def iter_entry_chunks(filepath, entries_per_chunk):
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as file:
+        prolog = b''
+        for line in file:
+            if b'<JMdict>' in line:
+                head, _, rest = line.partition(b'<JMdict>')
+                prolog += head
+                lines = [rest]
+                break
+            prolog += line
+        else:
+            return
+        count = 0
+        for line in file:
+            if b'</JMdict>' in line:
+                lines.append(line.partition(b'</JMdict>')[0])
+                break
+            lines.append(line)
+            count += line.count(b'</entry>')
+            if count >= entries_per_chunk:
+                yield prolog, b''.join(lines), file.tell() / size
+                lines = []
+                count = 0
+        yield prolog, b''.join(lines), 1.0
+
+# Runs in a worker process: parses one chunk with the document's own DTD so the
+# entities resolve, returns parse_entry results in document order
+def parse_chunk(prolog, chunk, entities):
+    root = Et.fromstring(prolog + b'<JMdict>' + chunk + b'</JMdict>')
+    return [parse_entry(entry, entities) for entry in root.iter('entry')]
+
+# Splits the entry stream into chunks, parses them in a process pool and merges the results
+# in document order, so entries of equal priority are stored in the same order as a serial build.
+# Only a few chunks are in flight at once to keep memory bounded.
+def build_index_parallel(xml_path, index_path, progress, workers, context):
+    entities = read_entities(xml_path)
+    writer = jmdict_index.IndexWriter(index_path)
+    count = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        pending = collections.deque()
+        def merge_next():
+            nonlocal count
+            future, fraction = pending.popleft()
+            for headwords, readings, entry in future.result():
+                writer.add(entry, headwords, readings)
+                count += 1
+            if progress:
+                progress(count, fraction)
+        for prolog, chunk, fraction in iter_entry_chunks(xml_path, CHUNK_ENTRIES):
+            pending.append((executor.submit(parse_chunk, prolog, chunk, entities), fraction))
+            if len(pending) >= workers * 2:
+                merge_next()
+        while pending:
+            merge_next()
+    writer.finish()
+    return len(writer)
@@ -0,0 +1,483 @@
+import functools
+import heapq
+import os
+import tempfile
+import zlib
+from array import array
+
+from . import datafile
+
+# On-disk JMdict index, in place of the dict_data pickle older versions loaded.
+# Keys are stored sorted as UTF-8 (byte order matches code point order) with an
+# open addressing hash table over them for O(1) lookups. Each key points at a list of
+# entry records in the records blob. Only the records that are looked up are ever decoded.
+INDEX_VERSION = 7
+
+FIELD_SEPARATOR = '\x1e'
+SENSE_SEPARATOR = '\x1f'
+GLOSS_SEPARATOR = '\x1d'
+
+DEFINITION_SEPARATOR = "<br>"
+
+# POS ids are stored as one character each, offset past the separators
+POS_ID_BASE = 0x100
+
+# The categories of POS the note logic (word type, conjugation) cares about, as bit flags
+POS_NOUN = 1 << 0
+POS_NA_ADJECTIVE = 1 << 1
+POS_I_ADJECTIVE = 1 << 2
+POS_VERB = 1 << 3
+POS_TRANSITIVE = 1 << 4
+POS_INTRANSITIVE = 1 << 5
+POS_ICHIDAN = 1 << 6
+POS_GODAN = 1 << 7
+POS_SURU = 1 << 8
+POS_KURU = 1 << 9
+
+# Categorises one JMdict POS string, e.g. "Ichidan verb" -> POS_VERB | POS_ICHIDAN
+@functools.lru_cache(maxsize=None)
+def pos_categories(pos):
+    lower = pos.lower()
+    flags = 0
+    if "noun" in lower:
+        flags |= POS_NOUN
+    if "adjectival nouns" in lower:
+        flags |= POS_NA_ADJECTIVE
+    if "adjective (keiyoushi)" in lower:
+        flags |= POS_I_ADJECTIVE
+    if "verb" in lower:
+        flags |= POS_VERB
+    if pos.startswith("transitive verb") or " transitive verb" in lower:
+        flags |= POS_TRANSITIVE
+    if "intransitive verb" in lower:
+        flags |= POS_INTRANSITIVE
+    if "ichidan" in lower:
+        flags |= POS_ICHIDAN
+    if "godan" in lower:
+        flags |= POS_GODAN
+    if "suru" in lower:
+        flags |= POS_SURU
+    if "kuru verb" in lower:
+        flags |= POS_KURU
+    return flags
+
+# Renders senses the way they go into the definition fields: "1: gloss, gloss<br>2: gloss"
+def render_definitions(senses):
+    return DEFINITION_SEPARATOR.join(f"{i}: {'; '.join(glosses)}".replace(";", ",") for i, glosses in enumerate(senses, start=1))
+
+# One dictionary entry.
+# reb: first reading, keb: first headword (the reb for kana only words),
+# readings: every (reb, kebs it's restricted to by re_restr) pair, an empty kebs tuple
+# meaning the reading goes with all of them,
+# pos: tuple of POS strings (shared with the index's POS table),
+# pos_flags: POS_* categories of all of them, senses: tuple of gloss tuples, one per sense,
+# definitions: the senses pre-rendered by render_definitions, stored in the index at build time
+class JMdictEntry:
+    __slots__ = ("reb", "keb", "readings", "pos", "pos_flags", "senses", "definitions")
+
+    def __init__(self, reb, pos, senses, definitions=None, keb=None, readings=None):
+        self.reb = reb
+        self.keb = reb if keb is None else keb
+        self.readings = ((reb, ()),) if readings is None else readings
+        self.pos = pos
+        self.senses = senses
+        self.definitions = render_definitions(senses) if definitions is None else definitions
+        self.pos_flags = 0
+        for value in pos:
+            self.pos_flags |= pos_categories(value)
+
+    def __eq__(self, other):
+        return (isinstance(other, JMdictEntry)
+                and (self.reb, self.keb, self.readings, self.pos, self.senses) == (other.reb, other.keb, other.readings, other.pos, other.senses))
+
+    def __repr__(self):
+        return f"JMdictEntry({self.reb!r}, {self.pos!r}, {self.senses!r}, keb={self.keb!r})"
+
+    def has_pos(self, flags):
+        return bool(self.pos_flags & flags)
+
+    # The readings that go with a headword, i.e. all but those restricted to other kebs
+    def readings_for(self, keb):
+        return [reb for reb, restrictions in self.readings if not restrictions or keb in restrictions]
+
+    # The first reading that goes with a headword (or the kana itself for a reading),
+    # reb when there's none
+    def reading_for(self, keb):
+        if any(reb == keb for reb, _ in self.readings):
+            return keb
+        readings = self.readings_for(keb)
+        return readings[0] if readings else self.reb
+
+    # Cuts the pre-rendered definitions down to the first limit senses without re-rendering.
+    # Returns (all of them, the first one without its "1: " prefix, the ones after the first)
+    def meanings(self, limit):
+        if limit <= 0 or not self.definitions:
+            return "", "", ""
+        breaks = []
+        position = self.definitions.find(DEFINITION_SEPARATOR)
+        while position >= 0 and len(breaks) < limit:
+            breaks.append(position)
+            position = self.definitions.find(DEFINITION_SEPARATOR, position + len(DEFINITION_SEPARATOR))
+        end = breaks[limit - 1] if len(breaks) >= limit else len(self.definitions)
+        first_end = breaks[0] if breaks else len(self.definitions)
+        primary = self.definitions[:first_end].removeprefix("1: ")
+        alternates = self.definitions[first_end + len(DEFINITION_SEPARATOR):end] if first_end < end else ""
+        return self.definitions[:end], primary, alternates
+
+    # All POS strings joined, as they used to be stored in dict_data
+    @property
+    def parts_of_speech_values(self):
+        return '; '.join(self.pos)
+
+# keb [RS] reading 1 [US] reading 2 ... [RS] POS ids [RS] sense 1 [US] sense 2 ... [RS] definitions
+# with the glosses of a sense separated by [GS], and likewise a reading's re_restr kebs after it
+def encode_record(entry, pos_ids):
+    readings = SENSE_SEPARATOR.join(GLOSS_SEPARATOR.join((reb,) + restrictions) for reb, restrictions in entry.readings)
+    pos = ''.join(chr(POS_ID_BASE + pos_ids[value]) for value in entry.pos)
+    senses = SENSE_SEPARATOR.join(GLOSS_SEPARATOR.join(sense) for sense in entry.senses)
+    return FIELD_SEPARATOR.join((entry.keb, readings, pos, senses, entry.definitions)).encode('utf-8')
+
+def decode_record(data, pos_table):
+    keb, readings, pos, senses, definitions = bytes(data).decode('utf-8').split(FIELD_SEPARATOR)
+    readings = tuple((parts[0], tuple(parts[1:])) for parts in (reading.split(GLOSS_SEPARATOR) for reading in readings.split(SENSE_SEPARATOR)))
+    return JMdictEntry(readings[0][0],
+                       tuple(pos_table[ord(c) - POS_ID_BASE] for c in pos),
+                       tuple(tuple(sense.split(GLOSS_SEPARATOR)) for sense in senses.split(SENSE_SEPARATOR)) if senses else (),
+                       definitions,
+                       keb,
+                       readings)
+
+def key_hash(key_bytes):
+    return zlib.crc32(key_bytes)
+
+# Highest (worst) rank, given to words with no priority tags at all. Lower ranks sort first.
+NO_PRIORITY = 0xFFFF
+
+# Turns the ke_pri/re_pri tags of a kanji or reading element into a rank, lower is more common.
+# The "1" lists (news1, ichi1, spec1, gai1) count most, then the nfXX frequency band, then the "2" lists.
+def priority_rank(tags):
+    if not tags:
+        return NO_PRIORITY
+    first = sum(1 for tag in tags if tag in ("news1", "ichi1", "spec1", "gai1"))
+    second = sum(1 for tag in tags if tag in ("news2", "ichi2", "spec2", "gai2"))
+    frequency = min((int(tag[2:]) for tag in tags if tag.startswith("nf") and tag[2:].isdigit()), default=49)
+    return (4 - first) * 1000 + frequency * 10 + (4 - second)
+
+# Collects keys for one table of the index. Each key maps to a list of record ids
+# ordered by rank, then by the order they were added in.
+# With ranked=False postings are kept in the order they were added with no ranks,
+# which takes far less memory for tables with many postings per key
+class KeyTableWriter:
+    def __init__(self, ranked=True):
+        self.ranked = ranked
+        self.postings = {}
+
+    def __len__(self):
+        return len(self.postings)
+
+    def __contains__(self, key):
+        return key in self.postings
+
+    def add(self, key, record_id, rank=NO_PRIORITY):
+        postings = self.postings.get(key)
+        if postings is None:
+            postings = self.postings[key] = [] if self.ranked else array('I')
+        postings.append((rank, record_id) if self.ranked else record_id)
+
+    # The sections for this table, prefixed with name.
+    # Keys are sorted as UTF-8, a power of two sized hash table at most half full maps
+    # them to their sorted position + 1 (0 is an empty slot). ranks holds the best rank
+    # of each key for ordering prefix matches, maxlen the length of the longest key in characters.
+    def sections(self, name):
+        encoded = sorted(key.encode('utf-8') for key in self.postings)
+        key_offsets = array('I', [0])
+        posting_offsets = array('I', [0])
+        postings = array('I')
+        ranks = array('H')
+        for key in encoded:
+            key_offsets.append(key_offsets[-1] + len(key))
+            if not self.ranked:
+                postings.extend(self.postings[key.decode('utf-8')])
+                posting_offsets.append(len(postings))
+                ranks.append(NO_PRIORITY)
+                continue
+            # sorted() is stable, so equal ranks keep the order they were added in
+            ordered = sorted(self.postings[key.decode('utf-8')], key=lambda posting: posting[0])
+            postings.extend(record_id for _, record_id in ordered)
+            posting_offsets.append(len(postings))
+            ranks.append(ordered[0][0])
+
+        size = 1
+        while size < len(encoded) * 2:
+            size *= 2
+        mask = size - 1
+        table = array('I', bytes(4 * size))
+        for position, key in enumerate(encoded):
+            slot = key_hash(key) & mask
+            while table[slot]:
+                slot = (slot + 1) & mask
+            table[slot] = position + 1
+
+        return {
+            name + ".keys": b''.join(encoded),
+            name + ".koffs": key_offsets,
+            name + ".hash": table,
+            name + ".poffs": posting_offsets,
+            name + ".posts": postings,
+            name + ".ranks": ranks,
+            name + ".maxlen": array('I', [max((len(key) for key in self.postings), default=0)]),
+        }
+
+# Collects entries and writes the index file. Records are spooled to a temporary
+# file as they're added so only the keys are held in memory while building.
+# There are two tables: headwords (each keb, or the first reb when there's no keb)
+# and readings (every reb). Both keep every entry for a key, most common first
+# by ke_pri/re_pri, so homographs like 生 or 上手 are all there.
+class IndexWriter:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.records = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(filepath)))
+        self.record_offsets = array('I', [0])
+        self.headwords = KeyTableWriter()
+        self.readings = KeyTableWriter()
+        self.pos_ids = {}
+
+    def __len__(self):
+        return len(self.headwords)
+
+    # headwords and readings are lists of (text, priority rank)
+    def add(self, entry, headwords, readings=()):
+        for value in entry.pos:
+            self.pos_ids.setdefault(value, len(self.pos_ids))
+        data = encode_record(entry, self.pos_ids)
+        record_id = len(self.record_offsets) - 1
+        self.records.write(data)
+        self.record_offsets.append(self.record_offsets[-1] + len(data))
+        for key, rank in headwords:
+            self.headwords.add(key, record_id, rank)
+        for key, rank in readings:
+            self.readings.add(key, record_id, rank)
+
+    def finish(self):
+        sections = {"pos_table": SENSE_SEPARATOR.join(self.pos_ids).encode('utf-8')}
+        sections.update(self.headwords.sections("headwords"))
+        sections.update(self.readings.sections("readings"))
+        sections["record_offsets"] = self.record_offsets
+        sections["records"] = self.records
+        datafile.write_datafile(self.filepath, INDEX_VERSION, sections)
+        self.records.close()
+
+# Read side of one KeyTableWriter table
+class KeyTable:
+    def __init__(self, data, name):
+        self.keys = data.section(name + ".keys")
+        self.key_offsets = data.array(name + ".koffs", 'I')
+        self.hash = data.array(name + ".hash", 'I')
+        self.posting_offsets = data.array(name + ".poffs", 'I')
+        self.postings = data.array(name + ".posts", 'I')
+        self.ranks = data.array(name + ".ranks", 'H')
+        # Length of the longest key, no prefix match can run past it
+        self.longest = data.array(name + ".maxlen", 'I')[0]
+
+    def __len__(self):
+        return len(self.key_offsets) - 1
+
+    def key_bytes(self, position):
+        return self.keys[self.key_offsets[position]:self.key_offsets[position + 1]]
+
+    def key_at(self, position):
+        return bytes(self.key_bytes(position)).decode('utf-8')
+
+    # Position of the key in sorted order, or -1 when it isn't in the table
+    def find(self, key):
+        encoded = key.encode('utf-8')
+        mask = len(self.hash) - 1
+        slot = key_hash(encoded) & mask
+        while True:
+            position = self.hash[slot]
+            if position == 0:
+                return -1
+            if self.key_bytes(position - 1) == encoded:
+                return position - 1
+            slot = (slot + 1) & mask
+
+    # Record ids for the key at position, best first
+    def records(self, position):
+        return self.postings[self.posting_offsets[position]:self.posting_offsets[position + 1]]
+
+    # First position in [low, high) whose key is not less than encoded (UTF-8 bytes)
+    def lower_bound(self, encoded, low=0, high=None):
+        if high is None:
+            high = len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if bytes(self.key_bytes(middle)) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # (start, end) positions of the keys starting with prefix. Two binary searches,
+    # 0xFF never occurs in UTF-8 so prefix + 0xFF sorts after every key with that prefix.
+    # low and high narrow the search, e.g. to the range of a shorter prefix.
+    def prefix_range(self, prefix, low=0, high=None):
+        encoded = prefix.encode('utf-8')
+        start = self.lower_bound(encoded, low, high)
+        return start, self.lower_bound(encoded + b'\xff', start, high)
+
+    def release(self):
+        for view in (self.keys, self.key_offsets, self.hash, self.posting_offsets, self.postings, self.ranks):
+            view.release()
+
+# Prefix matches looked at per table when completing. Keeps one or two character
+# prefixes (which match thousands of keys) within a few milliseconds.
+COMPLETION_SCAN_LIMIT = 20000
+
+# A suggestion for what's being typed: the matched key, the word it belongs to,
+# its reading and first gloss
+class Completion:
+    __slots__ = ("key", "word", "reading", "gloss")
+
+    def __init__(self, key, word, reading, gloss):
+        self.key = key
+        self.word = word
+        self.reading = reading
+        self.gloss = gloss
+
+    def __repr__(self):
+        return f"Completion({self.key!r}, {self.word!r}, {self.reading!r}, {self.gloss!r})"
+
+# Read-only view of an index file, behaves like the old dict_data for lookups
+class JMdictIndex:
+    def __init__(self, filepath):
+        self.data = datafile.DataFile(filepath)
+        if self.data.version != INDEX_VERSION:
+            version = self.data.version
+            self.data.close()
+            raise datafile.DataFileError(f"{filepath} is index version {version}, expected {INDEX_VERSION}")
+        pos_table = bytes(self.data.section("pos_table")).decode('utf-8')
+        self.pos_table = tuple(pos_table.split(SENSE_SEPARATOR)) if pos_table else ()
+        self.headwords = KeyTable(self.data, "headwords")
+        self.readings = KeyTable(self.data, "readings")
+        self.record_offsets = self.data.array("record_offsets", 'I')
+        self.records = self.data.section("records")
+
+    def __len__(self):
+        return len(self.headwords)
+
+    def __contains__(self, key):
+        return self.headwords.find(key) >= 0
+
+    def __iter__(self):
+        for position in range(len(self.headwords)):
+            yield self.headwords.key_at(position)
+
+    def record(self, record_id):
+        return decode_record(self.records[self.record_offsets[record_id]:self.record_offsets[record_id + 1]], self.pos_table)
+
+    # The most common entry for a headword
+    def get(self, key, default=None):
+        position = self.headwords.find(key)
+        if position < 0:
+            return default
+        return self.record(self.headwords.records(position)[0])
+
+    def __getitem__(self, key):
+        entry = self.get(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry
+
+    # Every entry listed under a headword, most common first
+    def entries(self, keb):
+        position = self.headwords.find(keb)
+        if position < 0:
+            return []
+        return [self.record(record_id) for record_id in self.headwords.records(position)]
+
+    # The entry for a headword that fits a known reading, e.g. 生 with なま picks "raw" over
+    # the more common せい "life". Falls back to the most common entry when none fits.
+    # Entries are stored best first, so this decodes records only until one matches.
+    def best_entry(self, keb, kana=None, default=None):
+        position = self.headwords.find(keb)
+        if position < 0:
+            return default
+        record_ids = self.headwords.records(position)
+        if kana:
+            for record_id in record_ids:
+                entry = self.record(record_id)
+                if kana in entry.readings_for(keb):
+                    return entry
+        return self.record(record_ids[0])
+
+    # Definitions of a headword as "1: gloss, gloss<br>2: gloss", cut to limit senses (0 for all).
+    # Replaces the search_def scan of the XML tree.
+    def definitions(self, keb, limit=0):
+        entry = self.get(keb)
+        if entry is None:
+            return ""
+        if limit <= 0:
+            return entry.definitions
+        return entry.meanings(limit)[0]
+
+    # First reading of a headword, replaces search_reb
+    def reading(self, keb):
+        entry = self.get(keb)
+        return entry.reading_for(keb) if entry is not None else ""
+
+    # POS strings of every entry under a headword joined with "; ", replaces search_pos
+    def parts_of_speech(self, keb):
+        values = {}
+        for entry in self.entries(keb):
+            values.update(dict.fromkeys(entry.pos))
+        return '; '.join(values)
+
+    # Every entry with a reading (reb) of kana, most common first. One hash lookup, no scanning.
+    def lookup_reading(self, kana):
+        position = self.readings.find(kana)
+        if position < 0:
+            return []
+        return [self.record(record_id) for record_id in self.readings.records(position)]
+
+    # Up to limit words whose headword or reading starts with prefix, most common first.
+    # Binary searches narrow each table to the keys with the prefix, only those are ranked.
+    # Every entry under a matching key is offered (上 as うえ, as かみ, ...), most common first, and
+    # so is every key of an entry that matches. A word and reading matched twice (a kana word is
+    # its own headword and reading) is only listed once.
+    def complete(self, prefix, limit=10):
+        if not prefix or limit <= 0:
+            return []
+        candidates = []
+        for table in (self.headwords, self.readings):
+            start, end = table.prefix_range(prefix)
+            end = min(end, start + COMPLETION_SCAN_LIMIT)
+            for position in heapq.nsmallest(limit, range(start, end), key=table.ranks.__getitem__):
+                candidates.append((table.ranks[position], table, position))
+        candidates.sort(key=lambda candidate: candidate[0])
+        completions = []
+        seen = set()
+        for _, table, position in candidates:
+            key = table.key_at(position)
+            for record_id in table.records(position):
+                entry = self.record(record_id)
+                if table is self.headwords:
+                    # The reading that goes with the headword matched, which re_restr may make other than the first
+                    word, reading = key, entry.reading_for(key)
+                else:
+                    # A reading restricted to some kebs goes with the first of those
+                    restrictions = next((restrictions for reb, restrictions in entry.readings if reb == key), ())
+                    word, reading = restrictions[0] if restrictions else entry.keb, key
+                if (record_id, word, reading) in seen:
+                    continue
+                seen.add((record_id, word, reading))
+                completions.append(Completion(key, word, reading, entry.senses[0][0] if entry.senses else ""))
+                if len(completions) >= limit:
+                    return completions
+        return completions
+
+    def close(self):
+        self.headwords.release()
+        self.readings.release()
+        for view in (self.record_offsets, self.records):
+            view.release()
+        self.data.close()
@@ -1,17 +1,14 @@
 from __future__ import annotations
 
-import json
 import os
-import xml.etree.ElementTree as Et
-import pickle
 import requests
 import base64
 import hashlib
 import pathlib
 import urllib
 
-from PyQt6.QtGui import QAction
-from PyQt6.QtWidgets import QDialog, QHBoxLayout, QLabel, QLineEdit, QDialogButtonBox, QVBoxLayout, QSpinBox, QCheckBox, QComboBox, QProgressBar
+from PyQt6.QtGui import QAction, QFontDatabase
+from PyQt6.QtWidgets import QDialog, QHBoxLayout, QLabel, QLineEdit, QDialogButtonBox, QVBoxLayout, QSpinBox, QCheckBox, QComboBox, QProgressBar, QPlainTextEdit
 
 # anki imports
 import aqt.qt
@@ -25,128 +22,48 @@ from anki.notes import Note
 from anki.media import MediaManager
 
 from . import sentence_examples;
+from . import sentence_db;
 from . import wanakana;
 from . import constants;
+from . import loader;
+from . import furigana_index;
+from . import jmdict_index;
+from . import jmdict_build;
+from . import artifacts;
+from . import datafile;
+from . import diagnostics;
+from . import deinflect;
+from . import segmenter;
+from . import known_words;
+from . import legacy_pickles;
+
+import_phase = diagnostics.load_timings.begin("startup: import add-on");
 
 # This is used to prevent excessive lookups
 previous_srcTxt = None
 
+# Index of the field being edited, suggestions are only shown while it's the source field
+focused_field_index = None
+
 dicts_path = os.path.join(os.path.dirname(__file__), constants.DIR_DICTIONARIES)
 
-def load_xml_file(filepath):
-    try:
-        tree = Et.parse(filepath)
-        root = tree.getroot()
-        return root
-    except FileNotFoundError:
-        print(f"File {filepath} not found.")
-        return None
-    except Et.ParseError:
-        print(f"Error parsing the file {filepath}.")
-        return None
-
-def build_dict_from_xml(root):
-    output = {}
-    for entry in root.iter('entry'):
-        parts_of_speech_values = set()
-        keb_entries = set()
-        for keb_entry in entry.findall('k_ele/keb'):
-            keb_entries.add(keb_entry.text)
-        pos_elements = entry.findall('sense/pos')
-        for pos in pos_elements:
-            # Check if <!ENTITY> in tag text and replace with full string
-            pos_text = pos.text
-            if pos_text and "&" in pos_text and ';' in pos_text:
-                entity_value = pos_text.replace('&', '').replace(';', '')
-                full_string = root.docinfo.internalDTD.entities.get(entity_value)
-                parts_of_speech_values.add(full_string if full_string else pos_text)
-            else:
-                parts_of_speech_values.add(pos_text)
-
-        senses = {}
-        for i, sense in enumerate(entry.iter('sense'), start=1):
-            glosses = [gloss.text for gloss in sense.iter('gloss')]
-            gloss_text = '; '.join(glosses)
-            senses[i] = f"{i}: {gloss_text}"
-        reb = entry.findall('r_ele/reb')[0].text.strip()
-        if len(keb_entries) == 0:
-          keb_entries.add(reb);  
-        for ke in keb_entries:
-            if ke not in output:
-                output[ke] = {"parts_of_speech_values": '; '.join(parts_of_speech_values),
-                              "senses": senses, "reb": reb}
-    return output
-
-# Takes a dictionary entry and a limit
-# Returns an array of english definitions of length no more than limit
-def get_senses(dict_item, limit=5):
-    arry = []
-    for number in range(1, limit+1):
-        if number in dict_item["senses"]:
-            sense = dict_item["senses"][number]
-            if (sense):
-                sense = sense.replace(";", ",")
-            arry.append(sense)
-    return arry
-
-def search_def(root, keb_text, def_limit=0):
-    return_val = ""
-    for entry in root.iter('entry'):
-        for keb in entry.iter('keb'):  # iterate over all 'keb' children of 'entry'
-            if keb.text == keb_text:  # compare the text of the 'keb' element with the text you're looking for
-                # Gather glosses from each sense
-                for i, sense in enumerate(entry.iter('sense'), start=1):
-                    glosses = [gloss.text for gloss in sense.iter('gloss')]
-                    gloss_text = '; '.join(glosses)
-                    return_val += f"{i}: {gloss_text}<br>"
-                    def_limit = def_limit - 1
-                    if def_limit == 0:
-                        break
-                return return_val[:-4] if return_val.endswith("<br>") else return_val
-    return return_val[:-4] if return_val.endswith("<br>") else return_val
-
-def search_reb(root, keb_text):
-    # Assuming root is an ElementTree instance, and element names are as per your code base
-    for entry in root.iter('entry'):
-        keb = entry.find('k_ele/keb')
-        if keb is not None and keb.text == keb_text:
-            return entry.findall('r_ele/reb')[0].text.strip()
-    return ""
-
-def search_pos(root, keb_text):
-    pos_values = set()
-    for entry in root.iter('entry'):
-        keb = entry.find('k_ele/keb')
-        if keb is not None and keb.text == keb_text:
-            pos_elements = entry.findall('sense/pos')
-            for pos in pos_elements:
-                # Check if <!ENTITY> in tag text and replace with full string
-                pos_text = pos.text
-                if pos_text and "&" in pos_text and ';' in pos_text:
-                    entity_value = pos_text.replace('&', '').replace(';', '')
-                    full_string = root.docinfo.internalDTD.entities.get(entity_value)
-                    pos_values.add(full_string if full_string else pos_text)
-                else:
-                    pos_values.add(pos_text)
-    return '; '.join(pos_values)
-
-def search_furigana(data, target_text):
-    for obj in data:
-        if obj['text'] == target_text:
-            furigana = obj['furigana']
-            result = ""
-            last_no_kanji = False
-            for fu in furigana:
-                if "rt" in fu:
-                    if last_no_kanji:
-                        result += " "
-                    result += fu['ruby']
-                    result += "[" + fu['rt'] + "]"
-                else:
-                    result += fu['ruby']
-                    last_no_kanji = True
-            return result
-    return ""
+# The loads every note update needs. Example sentences and known words are left out
+# while they're unavailable, the sentence load can take minutes the first time.
+REQUIRED_LOADS = (constants.DATA_FURIGANA, constants.DATA_JMDICT)
+
+# The old XML tree scans, now lookups in the JMdict index (the dict_data from data_loader)
+def search_def(index, keb_text, def_limit=0):
+    return index.definitions(keb_text, def_limit)
+
+def search_reb(index, keb_text):
+    return index.reading(keb_text)
+
+def search_pos(index, keb_text):
+    return index.parts_of_speech(keb_text)
+
+# Bracket furigana for a word from the furigana index, "" when it isn't there
+def search_furigana(index, target_text, reading=None):
+    return index.lookup(target_text, reading)
 
 
 def get_romaji(src_txt: str) -> str:
@@ -157,30 +74,30 @@ def get_romaji(src_txt: str) -> str:
     else:
         return ""
 
-def parts_of_speech_conversion(src_txt: str, type_str: str) -> str:
+def parts_of_speech_conversion(src_txt: str, jmdict_info) -> str:
     output_str = ""
-    if "noun" in type_str.lower():
+    if jmdict_info.has_pos(jmdict_index.POS_NOUN):
         output_str += "Noun<br>"
-    if "adjectival nouns" in type_str.lower():
+    if jmdict_info.has_pos(jmdict_index.POS_NA_ADJECTIVE):
         output_str += "な-adjective<br>"
-    if "adjective (keiyoushi)" in type_str.lower():
+    if jmdict_info.has_pos(jmdict_index.POS_I_ADJECTIVE):
         output_str += "い-adjective<br>"
-    if type_str.startswith("transitive verb") or " transitive verb" in type_str.lower():
+    if jmdict_info.has_pos(jmdict_index.POS_TRANSITIVE):
         output_str += "Transitive "
-        if "intransitive verb" in type_str.lower():
+        if jmdict_info.has_pos(jmdict_index.POS_INTRANSITIVE):
             output_str += "and intransitive "
-    if not(type_str.startswith("transitive verb") or " transitive verb" in type_str.lower()) and "intransitive verb" in type_str.lower():
+    if not jmdict_info.has_pos(jmdict_index.POS_TRANSITIVE) and jmdict_info.has_pos(jmdict_index.POS_INTRANSITIVE):
         output_str += "Intransitive "
-    if "ichidan" in type_str.lower():
+    if jmdict_info.has_pos(jmdict_index.POS_ICHIDAN):
         output_str += "ichidan verb<br>"
-    if "godan" in type_str.lower():
+    if jmdict_info.has_pos(jmdict_index.POS_GODAN):
         last_char = src_txt[-1:]
         output_str += "godan verb with '" + last_char + "' ending<br>"
-    if "suru" in type_str.lower():
+    if jmdict_info.has_pos(jmdict_index.POS_SURU):
         output_str += "suru verb " + src_txt + "する<br>"
     return output_str.strip().removesuffix("<br>") # remove any superfluous breaks
 
-def do_conjugation(src_txt: str, fields: list, note: Note, type_str: str) -> str:
+def do_conjugation(src_txt: str, fields: list, note: Note, jmdict_info) -> str:
     changed = False
     masu_form = "";
     te_form = "";
@@ -195,7 +112,7 @@ def do_conjugation(src_txt: str, fields: list, note: Note, type_str: str) -> str
     ending = src_txt[-1:];
     stem = src_txt[:-1];
     
-    if "verb" in type_str.lower():
+    if jmdict_info.has_pos(jmdict_index.POS_VERB):
         if "来る" == src_txt:
             masu_form = "来[き]ます";
             te_form = "来[き]て";
@@ -218,7 +135,7 @@ def do_conjugation(src_txt: str, fields: list, note: Note, type_str: str) -> str
             vol_form = "しろ";
             tai_form = "したい【です】";
             imp_form = "しろ ・ してください ・ しなさい";
-        elif "ichidan" in type_str.lower():
+        elif jmdict_info.has_pos(jmdict_index.POS_ICHIDAN):
             masu_form = stem + "ます"
             te_form = stem + "て"
             past_form = stem + "た";
@@ -229,7 +146,7 @@ def do_conjugation(src_txt: str, fields: list, note: Note, type_str: str) -> str
             vol_form = stem + "よう";
             tai_form = stem + "たい【です】";
             imp_form = stem + "ろ ・ " + stem + "てください ・ "+ stem + "なさい";
-        elif "godan" in type_str.lower():
+        elif jmdict_info.has_pos(jmdict_index.POS_GODAN):
             if "す" == ending:
                 masu_form = stem + "します";
                 te_form = stem + "して";
@@ -335,7 +252,7 @@ def do_conjugation(src_txt: str, fields: list, note: Note, type_str: str) -> str
                 vol_form = stem + "おう";
                 tai_form = stem + "いたい【です】";
                 imp_form = stem + "え ・ " + stem + "ってください ・ "+ stem + "いなさい";
-        elif "suru" in type_str.lower():
+        elif jmdict_info.has_pos(jmdict_index.POS_SURU):
             stem = src_txt.removesuffix("する") # just in case the dictionary def has suru in it already
             masu_form = stem + "します";
             te_form = stem + "して";
@@ -347,7 +264,7 @@ def do_conjugation(src_txt: str, fields: list, note: Note, type_str: str) -> str
             vol_form = stem + "しろ";
             tai_form = stem + "したい【です】";
             imp_form = stem + "しろ ・ " + stem + "してください ・ "+ stem + "しなさい";
-    elif "adjective (keiyoushi)" in type_str.lower():
+    elif jmdict_info.has_pos(jmdict_index.POS_I_ADJECTIVE):
         if "いい" == src_txt:
             stem = よ;
         te_form = stem + "くて";
@@ -378,7 +295,8 @@ def do_conjugation(src_txt: str, fields: list, note: Note, type_str: str) -> str
   
 def do_meanings(src_txt: str, fields: list, note: Note, def_num: int, jmdict_info) -> str:
     changed = False;
-    senses = get_senses(jmdict_info, def_num)
+    # The definitions are rendered when the index is built, this just cuts them to def_num senses
+    defs, primary, alternates = jmdict_info.meanings(def_num);
     
     # Grab the meanings, then put them all in the meaning field or 
     # split between meaning and alternates fields, if defined
@@ -386,22 +304,80 @@ def do_meanings(src_txt: str, fields: list, note: Note, def_num: int, jmdict_inf
         if config.get(constants.SETTING_ALTERNATES_FIELD) in fields:
             # If we're doing separate meaning and alternates fields,
             # Put the first definition into the meaning field by itself, with the 1: stripped
-            if (senses):
-                primary = senses.pop(0).removeprefix("1: ")
+            if primary:
                 if insert_if_empty(fields, note, constants.SETTING_MEANING_FIELD, primary):
                     changed = True;
-                if senses:
-                    alternates = "<br>".join(senses);
+                if alternates:
                     if insert_if_empty(fields, note, constants.SETTING_ALTERNATES_FIELD, alternates):
                         changed = True;
         else: # otherwise, we just put all meanings into a list in the meaning field
-            if senses:
-                defs = "<br>".join(senses);
+            if defs:
                 if insert_if_empty(fields, note, constants.SETTING_MEANING_FIELD, defs):
                     changed = True;
             
     return changed
  
+# Not a single word, so treat it as a sentence: split it into dictionary words and
+# fill in the furigana, reading and a gloss per word
+def do_sentence(src_txt: str, fields: list, note: Note, dict_data, furi_data) -> bool:
+    changed = False;
+    segments = segmenter.segment(dict_data, src_txt);
+    words = [segment for segment in segments if segment.entry is not None];
+    if len(words) < 2:
+        return changed;
+
+    if config.get(constants.SETTING_FURI_DEST_FIELD) in fields:
+        furigana = "";
+        for segment in segments:
+            rendered = segment_furigana(furi_data, segment);
+            if furigana and "[" in rendered:
+                furigana += " "; # marks where the word starts for Anki's furigana filter
+            furigana += rendered;
+        if insert_if_empty(fields, note, constants.SETTING_FURI_DEST_FIELD, furigana):
+            changed = True;
+
+    if config.get(constants.SETTING_KANA_DEST_FIELD) in fields:
+        if insert_if_empty(fields, note, constants.SETTING_KANA_DEST_FIELD, "".join(segment.reading for segment in segments)):
+            changed = True;
+
+    if config.get(constants.SETTING_MEANING_FIELD) in fields:
+        glosses = [];
+        for word in words:
+            line = word.term;
+            reading = word.entry.reading_for(word.term);
+            if reading != word.term:
+                line += "【" + reading + "】";
+            _, primary, _ = word.entry.meanings(1);
+            glosses.append(line + ": " + primary);
+        if insert_if_empty(fields, note, constants.SETTING_MEANING_FIELD, "<br>".join(glosses)):
+            changed = True;
+    return changed;
+
+# Furigana for one piece of a segmented sentence. Conjugated words take the dictionary
+# form's furigana with the conjugated ending swapped in (食[た]べる -> 食[た]べました).
+def segment_furigana(furi_data, segment) -> str:
+    if segment.entry is None or wanakana.is_kana(segment.text):
+        return segment.text;
+    if segment.term == segment.text:
+        return search_furigana(furi_data, segment.text, segment.entry.reading_for(segment.text)) or furigana_from_reading(segment.text, segment.reading);
+    rendered = search_furigana(furi_data, segment.term, segment.entry.reading_for(segment.term));
+    common = segmenter.common_prefix_length(segment.term, segment.text);
+    ending = segment.term[common:];
+    if not rendered or not rendered.endswith(ending):
+        return furigana_from_reading(segment.text, segment.reading);
+    return rendered[:len(rendered) - len(ending)] + segment.text[common:];
+
+# For words JmdictFurigana doesn't have: the whole kanji part gets the reading less the
+# kana ending, e.g. 行きました/いきました -> 行[い]きました
+def furigana_from_reading(text: str, reading: str) -> str:
+    stem = text;
+    while stem and wanakana.is_kana(stem[-1]):
+        stem = stem[:-1];
+    ending = text[len(stem):];
+    if not stem or any(wanakana.is_kana(char) for char in stem) or not reading.endswith(ending) or len(reading) == len(ending):
+        return text;
+    return stem + "[" + reading[:len(reading) - len(ending)] + "]" + ending;
+
 def do_pitch(src_txt: str, fields: list, note: Note, jmdict_info) -> str: 
     changed = False;
     
@@ -454,51 +430,167 @@ def on_focus_lost(changed: bool, note: Note, current_field_index: int) -> bool:
     
     # Check if it's the same as config, if so proceed
     if modified_field == config[constants.SETTING_SRC_FIELD]:
+        update_known_word(note);
         # Strip for good measure
         src_txt = aqt.mw.col.media.strip(note[modified_field]);
         if src_txt != "" and (previous_srcTxt is None or src_txt != previous_srcTxt):
+            # Don't block the editor while the dictionaries are still loading in the background
+            if not data_loader.is_ready(*REQUIRED_LOADS):
+                data_loader.start();
+                aqt.utils.tooltip(constants.GUI_STILL_LOADING);
+                return changed;
+            if report_failed_load(REQUIRED_LOADS):
+                return changed;
             changed = update_note(note, src_txt);
+            if config.get(constants.SETTING_SENTENCE_DEST_FIELD) in fields and not data_loader.is_ready(constants.DATA_SENTENCES):
+                aqt.utils.tooltip(constants.GUI_SENTENCES_STILL_LOADING);
                    
     return changed;
-    
-def update_note(note: Note, src_txt):
+
+# A load that has finished without failing
+def load_available(name):
+    return data_loader.is_ready(name) and not data_loader.failed(name);
+
+# Shows a tooltip for the first of the loads that failed rather than letting data_loader.get
+# raise from a GUI hook, True when there was one
+def report_failed_load(names):
+    for name in names:
+        error = data_loader.error(name);
+        if error is not None:
+            aqt.utils.tooltip(constants.GUI_LOAD_FAILED.format(name=name, error=error));
+            return True;
+    return False;
+
+# The known words to prefer in example sentences, None when that's off or they aren't loaded
+def known_words_for_sentences():
+    if config.get(constants.SETTING_PREFER_KNOWN_WORDS, False) and load_available(constants.DATA_KNOWN_WORDS):
+        return data_loader.get(constants.DATA_KNOWN_WORDS);
+    return None;
+
+# Keeps the known words up to date as notes are added and their word field edited.
+# Until the bulk load has run there's nothing to update, it will read the note itself.
+def update_known_word(note: Note):
+    src_field = config.get(constants.SETTING_SRC_FIELD, "");
+    if note.id and src_field in note and load_available(constants.DATA_KNOWN_WORDS):
+        data_loader.get(constants.DATA_KNOWN_WORDS).set_word(note.id, note[src_field]);
+
+def on_notes_will_be_deleted(col, note_ids):
+    if load_available(constants.DATA_KNOWN_WORDS):
+        data_loader.get(constants.DATA_KNOWN_WORDS).remove_notes(note_ids);
+
+# Reading every note for the known words costs time on large collections, so the load and the
+# hooks keeping it up to date are only there while prefer_known_words is on
+known_words_enabled = False;
+def set_known_words_enabled(enabled):
+    global known_words_enabled
+    if enabled == known_words_enabled:
+        return;
+    known_words_enabled = enabled;
+    hooks = ((aqt.gui_hooks.add_cards_did_add_note, update_known_word), (anki.hooks.notes_will_be_deleted, on_notes_will_be_deleted));
+    if enabled:
+        data_loader.register(constants.DATA_KNOWN_WORDS, load_known_words);
+        for hook, func in hooks:
+            hook.append(func);
+        # Turned on from the settings, the profile's already open
+        if aqt.mw.col is not None:
+            data_loader.start();
+    else:
+        for hook, func in hooks:
+            hook.remove(func);
+        data_loader.unregister(constants.DATA_KNOWN_WORDS);
+
+def on_focus_field(note: Note, current_field_index: int):
+    global focused_field_index
+    focused_field_index = current_field_index;
+
+# As you type in the source field, show the most common dictionary words starting with what's there
+def on_typing_timer(note: Note):
+    suggestion_num = config.get(constants.SETTING_NUM_SUGGESTIONS, 0);
+    if suggestion_num <= 0 or focused_field_index is None or not load_available(constants.DATA_JMDICT):
+        return;
+    fields = aqt.mw.col.models.field_names(note.note_type());
+    if focused_field_index >= len(fields) or fields[focused_field_index] != config[constants.SETTING_SRC_FIELD]:
+        return;
+    src_txt = aqt.mw.col.media.strip(note[fields[focused_field_index]]).strip();
+    if src_txt == "":
+        return;
+    completions = data_loader.get(constants.DATA_JMDICT).complete(src_txt, suggestion_num);
+    if completions:
+        aqt.utils.tooltip("<br>".join(format_completion(completion) for completion in completions), period=constants.GUI_SUGGESTION_TOOLTIP_MS);
+
+def format_completion(completion):
+    text = completion.word;
+    if completion.reading != completion.word:
+        text += "【" + completion.reading + "】";
+    if completion.gloss:
+        text += " " + completion.gloss;
+    return text;
+
+# With an allocator (batch runs), the note is added to it instead of getting its example sentences here
+def update_note(note: Note, src_txt, allocator: sentence_examples.SentenceAllocator = None):
     changed = False;
     fields = aqt.mw.col.models.field_names(note.note_type());
+    jmdict_furi_data = data_loader.get(constants.DATA_FURIGANA);
+    dict_data = data_loader.get(constants.DATA_JMDICT);
+    kana_txt = get_field(fields, note, constants.SETTING_KANA_DEST_FIELD);
+    
+    def_num = config[constants.SETTING_NUM_DEFS]
     
+    # Homographs (生, 上手) have several entries, a filled in kana field picks between them
+    jmdict_info = dict_data.best_entry(src_txt, kana_txt);
+
     # Added the field checks for people who don't have all fields for whatever reason
+    # The furigana follows the kana field, or else the reading of the entry we picked
     if config.get(constants.SETTING_FURI_DEST_FIELD) in fields:
-        if insert_if_empty(fields, note, constants.SETTING_FURI_DEST_FIELD, search_furigana(jmdict_furi_data, src_txt)):
+        furigana_reading = kana_txt or (jmdict_info.reading_for(src_txt) if jmdict_info is not None else "");
+        if insert_if_empty(fields, note, constants.SETTING_FURI_DEST_FIELD, search_furigana(jmdict_furi_data, src_txt, furigana_reading)):
             changed = True;
     
-    kana_txt = get_field(fields, note, constants.SETTING_KANA_DEST_FIELD);
-    def_num = config[constants.SETTING_NUM_DEFS]
-    
-    jmdict_info = dict_data.get(src_txt, None);
+    if jmdict_info is None and wanakana.is_kana(src_txt):
+        # Kana typed for a word normally written in kanji, take the most common entry with that reading
+        candidates = dict_data.lookup_reading(src_txt);
+        if candidates:
+            jmdict_info = candidates[0];
+    # Conjugated input (食べました, 高くなかった), fill the fields from the dictionary form
+    word = src_txt;
+    if jmdict_info is None:
+        match = deinflect.find_dictionary_form(dict_data, src_txt);
+        if match is not None:
+            word = match.term;
+            jmdict_info = match.entry;
     if jmdict_info is not None:
         
-        if do_meanings(src_txt, fields, note, def_num, jmdict_info):
+        if do_meanings(word, fields, note, def_num, jmdict_info):
             changed = True;
          
         if config.get(constants.SETTING_KANA_DEST_FIELD) in fields:
-            if insert_if_empty(fields, note, constants.SETTING_KANA_DEST_FIELD, jmdict_info.get("reb", "")):
+            if insert_if_empty(fields, note, constants.SETTING_KANA_DEST_FIELD, jmdict_info.reading_for(word)):
                 changed = True;
             kana_txt = get_field(fields, note, constants.SETTING_KANA_DEST_FIELD);
                 
         if config.get(constants.SETTING_TYPE_DEST_FIELD) in fields:
-            if insert_if_empty(fields, note, constants.SETTING_TYPE_DEST_FIELD, parts_of_speech_conversion(src_txt, jmdict_info.get("parts_of_speech_values", ""))):
+            if insert_if_empty(fields, note, constants.SETTING_TYPE_DEST_FIELD, parts_of_speech_conversion(word, jmdict_info)):
                 changed = True;
                 
-        if config.get(constants.SETTING_SENTENCE_DEST_FIELD) in fields:
+        if allocator is not None:
+            if get_field(fields, note, constants.SETTING_SENTENCE_DEST_FIELD) == "" and config.get(constants.SETTING_SENTENCE_DEST_FIELD) in fields:
+                allocator.add(note.id, word);
+        elif config.get(constants.SETTING_SENTENCE_DEST_FIELD) in fields and load_available(constants.DATA_SENTENCES):
             sentence_num = config[constants.SETTING_NUM_SENTENCES];
-            if insert_if_empty(fields, note, constants.SETTING_SENTENCE_DEST_FIELD, jsl.find_example_sentences_by_word_formatted(src_txt, sentence_num)):
+            jsl = data_loader.get(constants.DATA_SENTENCES);
+            known = known_words_for_sentences();
+            if insert_if_empty(fields, note, constants.SETTING_SENTENCE_DEST_FIELD, jsl.find_example_sentences_by_word_formatted(word, sentence_num, config.get(constants.SETTING_SENTENCE_RANKING, sentence_examples.RANK_BY_DATE), config.get(constants.SETTING_SENTENCE_TRANSLATIONS, False), known, dict_data)):
                 changed = True;
             
-        if do_conjugation(src_txt, fields, note, jmdict_info.get("parts_of_speech_values", "")):
+        if do_conjugation(word, fields, note, jmdict_info):
             changed = True;
+    elif do_sentence(src_txt, fields, note, dict_data, jmdict_furi_data):
+        changed = True;
+        kana_txt = get_field(fields, note, constants.SETTING_KANA_DEST_FIELD);
     
             
     if config.get(constants.SETTING_AUDIO_DEST_FIELD) in fields:
-        if do_audio(src_txt, kana_txt, fields, note, jmdict_info):
+        if do_audio(word, kana_txt, fields, note, jmdict_info):
             changed = True;
             
     if config.get(constants.SETTING_ROMAJI_DEST_FIELD) in fields:
@@ -679,6 +771,43 @@ def settings_dialog():
     box_sentc_nums.addWidget(label_sentc_nums)
     box_sentc_nums.addWidget(text_sentc_nums)
 
+    box_sentc_ranking = QHBoxLayout()
+    label_sentc_ranking = QLabel("Sentence Ranking:")
+    text_sentc_ranking = QComboBox()
+    text_sentc_ranking.addItem("Oldest first", sentence_examples.RANK_BY_DATE)
+    text_sentc_ranking.addItem("Rating, length and date", sentence_examples.RANK_BY_SCORE)
+    text_sentc_ranking.setMinimumWidth(200)
+    box_sentc_ranking.addWidget(label_sentc_ranking)
+    box_sentc_ranking.addWidget(text_sentc_ranking)
+
+    box_prefer_known = QHBoxLayout()
+    label_prefer_known = QLabel("Prefer Sentences With Known Words:")
+    text_prefer_known = QCheckBox()
+    box_prefer_known.addWidget(label_prefer_known)
+    box_prefer_known.addWidget(text_prefer_known)
+
+    box_sentc_engine = QHBoxLayout()
+    label_sentc_engine = QLabel("Sentence Storage:")
+    text_sentc_engine = QComboBox()
+    text_sentc_engine.addItem("Memory mapped file", sentence_examples.ENGINE_COLUMNS)
+    text_sentc_engine.addItem("SQLite full text search", sentence_examples.ENGINE_SQLITE)
+    text_sentc_engine.setMinimumWidth(200)
+    box_sentc_engine.addWidget(label_sentc_engine)
+    box_sentc_engine.addWidget(text_sentc_engine)
+
+    box_sentc_translations = QHBoxLayout()
+    label_sentc_translations = QLabel("English Translations:")
+    text_sentc_translations = QCheckBox()
+    box_sentc_translations.addWidget(label_sentc_translations)
+    box_sentc_translations.addWidget(text_sentc_translations)
+
+    box_suggest_nums = QHBoxLayout()
+    label_suggest_nums = QLabel("Number of Suggestions:")
+    text_suggest_nums = QSpinBox()
+    text_suggest_nums.setMinimumWidth(200)
+    box_suggest_nums.addWidget(label_suggest_nums)
+    box_suggest_nums.addWidget(text_suggest_nums)
+
     box_te = QHBoxLayout()
     label_te = QLabel("-te form field:")
     text_te = QLineEdit("")
@@ -765,6 +894,11 @@ def settings_dialog():
         text_def_nums.setValue(config.get(constants.SETTING_NUM_DEFS, 5));
         text_sentence.setText(config.get(constants.SETTING_SENTENCE_DEST_FIELD, "Examples"));
         text_sentc_nums.setValue(config.get(constants.SETTING_NUM_SENTENCES, 3));
+        text_suggest_nums.setValue(config.get(constants.SETTING_NUM_SUGGESTIONS, 5));
+        text_sentc_ranking.setCurrentIndex(max(text_sentc_ranking.findData(config.get(constants.SETTING_SENTENCE_RANKING, sentence_examples.RANK_BY_DATE)), 0));
+        text_sentc_engine.setCurrentIndex(max(text_sentc_engine.findData(config.get(constants.SETTING_SENTENCE_ENGINE, sentence_examples.ENGINE_COLUMNS)), 0));
+        text_prefer_known.setChecked(config.get(constants.SETTING_PREFER_KNOWN_WORDS, False));
+        text_sentc_translations.setChecked(config.get(constants.SETTING_SENTENCE_TRANSLATIONS, False));
         text_masu.setText(config.get(constants.SETTING_MASU_DEST_FIELD, "not_set"));
         text_te.setText(config.get(constants.SETTING_TE_DEST_FIELD, "not_set"));
         text_past.setText(config.get(constants.SETTING_PAST_DEST_FIELD, "not_set"));
@@ -789,6 +923,11 @@ def settings_dialog():
         config[constants.SETTING_NUM_DEFS] = text_def_nums.value();
         config[constants.SETTING_SENTENCE_DEST_FIELD] = text_sentence.text();
         config[constants.SETTING_NUM_SENTENCES] = text_sentc_nums.value();
+        config[constants.SETTING_NUM_SUGGESTIONS] = text_suggest_nums.value();
+        config[constants.SETTING_SENTENCE_RANKING] = text_sentc_ranking.currentData();
+        config[constants.SETTING_SENTENCE_ENGINE] = text_sentc_engine.currentData();
+        config[constants.SETTING_PREFER_KNOWN_WORDS] = text_prefer_known.isChecked();
+        config[constants.SETTING_SENTENCE_TRANSLATIONS] = text_sentc_translations.isChecked();
         config[constants.SETTING_MASU_DEST_FIELD] = text_masu.text();
         config[constants.SETTING_TE_DEST_FIELD] = text_te.text();
         config[constants.SETTING_PAST_DEST_FIELD] = text_past.text();
@@ -801,6 +940,7 @@ def settings_dialog():
         config[constants.SETTING_IMP_DEST_FIELD] = text_imp.text();
         
         aqt.mw.addonManager.writeConfig(__name__, config);
+        set_known_words_enabled(config[constants.SETTING_PREFER_KNOWN_WORDS]);
         
         dialog.close();
 
@@ -820,6 +960,11 @@ def settings_dialog():
         layout.addLayout(box_def_nums);
         layout.addLayout(box_sentence);
         layout.addLayout(box_sentc_nums);
+        layout.addLayout(box_sentc_ranking);
+        layout.addLayout(box_sentc_translations);
+        layout.addLayout(box_prefer_known);
+        layout.addLayout(box_sentc_engine);
+        layout.addLayout(box_suggest_nums);
         
         layout.addLayout(box_masu);
         layout.addLayout(box_te);
@@ -842,6 +987,61 @@ def settings_dialog():
 
     dialog.exec();
     
+# Batch updates fill in example sentences too, so show a loading state on the progress bar until
+# the sentences have loaded along with the dictionaries. The buttons stay off from here on so OK
+# can't be clicked again while events are processed. False when a required load failed.
+def wait_for_data(progress_bar: QProgressBar, button_box: QDialogButtonBox):
+    button_box.setEnabled(False);
+    names = REQUIRED_LOADS + (constants.DATA_SENTENCES,);
+    if config.get(constants.SETTING_PREFER_KNOWN_WORDS, False):
+        names += (constants.DATA_KNOWN_WORDS,);
+    if not data_loader.is_ready(*names):
+        data_loader.start();
+        progress_bar.setFormat(constants.GUI_STILL_LOADING);
+        while not data_loader.is_ready(*names):
+            aqt.mw.app.processEvents();
+            data_loader.wait(0.1);
+        progress_bar.setFormat("%v/%m notes updated");
+    return not report_failed_load(REQUIRED_LOADS);
+
+# Fills in every note, then gives out the example sentences across all of them at once so
+# the same sentences don't show up on card after card. Notes waiting on their sentences are kept
+# until then and saved once. Without a sentence field or sentences to give, there's no allocator.
+def update_notes(note_ids, progress_bar: QProgressBar):
+    src_field = config.get(constants.SETTING_SRC_FIELD, "");
+    allocator = None;
+    pending = {};
+    for idx, note_id in enumerate(note_ids):
+        note = aqt.mw.col.getNote(note_id);
+        if src_field in note and note[src_field]:
+            fields = aqt.mw.col.models.field_names(note.note_type());
+            if allocator is None and config.get(constants.SETTING_SENTENCE_DEST_FIELD) in fields and load_available(constants.DATA_SENTENCES):
+                allocator = sentence_examples.SentenceAllocator(data_loader.get(constants.DATA_SENTENCES), config[constants.SETTING_NUM_SENTENCES],
+                                                                config.get(constants.SETTING_SENTENCE_RANKING, sentence_examples.RANK_BY_DATE),
+                                                                known_words_for_sentences(), data_loader.get(constants.DATA_JMDICT));
+            allocated = len(allocator) if allocator is not None else 0;
+            changed = update_note(note, note[src_field], allocator);
+            if allocator is not None and len(allocator) > allocated:
+                pending[note_id] = (note, changed);
+            elif changed:
+                note.flush();
+        progress_bar.setValue(idx + 1);
+    if not pending:
+        return;
+
+    sentences_by_note = allocator.allocate();
+    translations = config.get(constants.SETTING_SENTENCE_TRANSLATIONS, False);
+    progress_bar.setRange(0, len(pending));
+    progress_bar.setFormat("%v/%m notes given example sentences");
+    for idx, (note_id, (note, changed)) in enumerate(pending.items()):
+        if note_id in sentences_by_note:
+            fields = aqt.mw.col.models.field_names(note.note_type());
+            if insert_if_empty(fields, note, constants.SETTING_SENTENCE_DEST_FIELD, sentence_examples.format_sentences(sentences_by_note[note_id], translations)):
+                changed = True;
+        if changed:
+            note.flush();
+        progress_bar.setValue(idx + 1);
+
 def batch_update_dialog():
     dialog = QDialog(aqt.mw);
     dialog.setWindowTitle(constants.GUI_BROWSER_BATCH_DIALOG_TITLE);
@@ -878,13 +1078,8 @@ def batch_update_dialog():
                 note_ids = aqt.mw.col.db.list(
                     "SELECT id FROM notes WHERE mid = ?", model["id"]
                 );
-                for idx, note_id in enumerate(note_ids):
-                    note = aqt.mw.col.getNote(note_id);
-                    src_field = config.get(constants.SETTING_SRC_FIELD, "");
-                    if src_field in note and note[src_field]:
-                        if update_note(note, note[src_field]):
-                            note.flush();
-                    progress_bar.setValue(idx + 1);
+                if wait_for_data(progress_bar, button_box):
+                    update_notes(note_ids, progress_bar);
         dialog.close();
         
     def on_cancel_clicked():
@@ -918,6 +1113,36 @@ def batch_update_dialog():
     dialog.setLayout(layout);
     dialog.exec();
     
+# Read-only view of how long each load phase took this session
+def diagnostics_dialog():
+    dialog = QDialog(aqt.mw);
+    dialog.setWindowTitle(constants.GUI_DIAGNOSTICS_DIALOG_TITLE);
+    
+    text = QPlainTextEdit();
+    text.setReadOnly(True);
+    text.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap);
+    text.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont));
+    text.setMinimumSize(720, 320);
+    
+    def refresh():
+        summary = diagnostics.load_timings.summary();
+        if not data_loader.is_ready():
+            summary += "\n\n" + constants.GUI_STILL_LOADING;
+        summary += "\n\nLog file: " + str(diagnostics.load_timings.log_file);
+        text.setPlainText(summary);
+    
+    button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Close);
+    refresh_button = button_box.addButton("Refresh", QDialogButtonBox.ButtonRole.ActionRole);
+    refresh_button.clicked.connect(refresh);
+    button_box.rejected.connect(dialog.close);
+    
+    layout = QVBoxLayout(dialog);
+    layout.addWidget(text);
+    layout.addWidget(button_box);
+    dialog.setLayout(layout);
+    refresh();
+    dialog.exec();
+    
 def init_menu():
   
     def browerMenusInit(browser: aqt.browser.Browser):
@@ -952,13 +1177,8 @@ def init_menu():
             
             def on_ok_clicked():
               
-                for idx, note_id in enumerate(notes):
-                    note = aqt.mw.col.getNote(note_id);
-                    src_field = config.get(constants.SETTING_SRC_FIELD, "");
-                    if src_field in note and note[src_field]:
-                        if update_note(note, note[src_field]):
-                            note.flush();
-                    progress_bar.setValue(idx + 1);
+                if wait_for_data(progress_bar, button_box):
+                    update_notes(notes, progress_bar);
                 dialog.close();
             
             def on_cancel_clicked():
@@ -977,6 +1197,10 @@ def init_menu():
         aqt.qconnect(selected_batch_browser_update.triggered, selected_batch_update_dialog);
         menu.addAction(selected_batch_browser_update);
         
+        action_browser_diagnostics = QAction(constants.GUI_BROWSER_DIAGNOSTICS_DIALOG_TITLE, browser);
+        aqt.qconnect(action_browser_diagnostics.triggered, diagnostics_dialog);
+        menu.addAction(action_browser_diagnostics);
+        
     action_settings = QAction(constants.GUI_SETTINGS_DIALOG_TITLE, aqt.mw);
     aqt.qconnect(action_settings.triggered, settings_dialog);
     aqt.mw.form.menuTools.addAction(action_settings);
@@ -985,11 +1209,17 @@ def init_menu():
     aqt.qconnect(action_batch_update.triggered, batch_update_dialog);
     aqt.mw.form.menuTools.addAction(action_batch_update);
     
+    action_diagnostics = QAction(constants.GUI_DIAGNOSTICS_DIALOG_TITLE, aqt.mw);
+    aqt.qconnect(action_diagnostics.triggered, diagnostics_dialog);
+    aqt.mw.form.menuTools.addAction(action_diagnostics);
+    
     # browser menus
     aqt.gui_hooks.browser_menus_did_init.append(browerMenusInit)
     
     # GUI Hooks
     aqt.gui_hooks.editor_did_unfocus_field.append(on_focus_lost);
+    aqt.gui_hooks.editor_did_focus_field.append(on_focus_field);
+    aqt.gui_hooks.editor_did_fire_typing_timer.append(on_typing_timer);
     aqt.gui_hooks.editor_did_init_buttons.append(editor_button_setup);
     
 def get_field_names_array():
@@ -1037,45 +1267,239 @@ def editor_button_setup(buttons, editor):
 
 
 
+# Loads a derived file from dicts/, building it first when it's missing or was made by a
+# different builder version. When only its sources (or build config) changed, the current
+# file keeps serving lookups while a fresh one is built in the background and swapped in.
+# build(path) writes the artifact to path, open_artifact(path) loads it.
+# on_install, when given, runs on the main thread once a rebuilt file has been swapped in.
+# The sources are described for the manifest before building, see artifacts.write_manifest.
+def load_artifact(name, artifact_file, sources, builder_version, build_config, build, open_artifact, on_install=None):
+    timings = diagnostics.load_timings;
+    artifacts.remove_leftover_temps(artifact_file);
+    with timings.phase(f"{name}: check") as phase:
+        status = artifacts.check_artifact(artifact_file, sources, builder_version, build_config);
+    if status in (artifacts.MISSING, artifacts.INCOMPATIBLE):
+        with timings.phase(f"{name}: build") as phase:
+            described = artifacts.describe_sources(sources);
+            with artifacts.atomic_path(artifact_file) as temp_file:
+                phase.items = build(temp_file);
+                datafile.verify(temp_file);
+            artifacts.write_manifest(artifact_file, sources, builder_version, build_config, described);
+    elif status == artifacts.STALE:
+        refresh_artifact(name, artifact_file, sources, builder_version, build_config, build, open_artifact, on_install);
+    elif status == artifacts.LEGACY:
+        print(f"{os.path.basename(artifact_file)} was made by an older version and there's nothing in the dicts folder to rebuild it from, using it as it is.");
+    with timings.phase(f"{name}: load") as phase:
+        try:
+            # Checked in full once after a build, and again only if the file has changed since
+            if not artifacts.artifact_verified(artifact_file):
+                datafile.verify(artifact_file);
+                artifacts.mark_verified(artifact_file);
+            value = open_artifact(artifact_file);
+        except datafile.DataFileError as inst:
+            # Damaged (a failed checksum, cut short) or written by another version, build it again
+            print(f"{os.path.basename(artifact_file)} can't be read, rebuilding it.");
+            print(inst);
+            described = artifacts.describe_sources(sources);
+            with artifacts.atomic_path(artifact_file) as temp_file:
+                build(temp_file);
+                datafile.verify(temp_file);
+            artifacts.write_manifest(artifact_file, sources, builder_version, build_config, described);
+            value = open_artifact(artifact_file);
+        phase.items = len(value);
+    return value;
+
+# Rebuilds a loaded artifact on the worker thread, the loaded one serving lookups until the new
+# one is swapped in on the main thread
+def refresh_artifact(name, artifact_file, sources, builder_version, build_config, build, open_artifact, on_install=None):
+    print(f"{os.path.basename(artifact_file)} is out of date, rebuilding in the background.");
+    def rebuild():
+        temp_file = artifacts.temp_path(artifact_file);
+        try:
+            with diagnostics.load_timings.phase(f"{name}: rebuild") as phase:
+                described = artifacts.describe_sources(sources);
+                phase.items = build(temp_file);
+                datafile.verify(temp_file);
+        except BaseException:
+            artifacts.remove_temp(temp_file);
+            raise;
+        return temp_file, described;
+    def install(temp_file, described):
+        # Runs on the main thread so nothing is mid-lookup on the old file while it's swapped
+        old = data_loader.get(name);
+        if hasattr(old, "close"):
+            old.close();
+        try:
+            os.replace(temp_file, artifact_file);
+        except BaseException:
+            artifacts.remove_temp(temp_file);
+            raise;
+        artifacts.write_manifest(artifact_file, sources, builder_version, build_config, described);
+        data_loader.replace(name, open_artifact(artifact_file));
+        print(f"Rebuilt {os.path.basename(artifact_file)}.");
+        if on_install is not None:
+            on_install();
+    data_loader.refresh(name, rebuild, lambda result: aqt.mw.taskman.run_on_main(lambda: install(*result)));
+
 # Dictionary Furigana Dictionary
-with open(os.path.join(dicts_path, constants.FILE_JMDICT_JSON), 'r', encoding='utf-8-sig') as f:
-    jmdict_furi_data = json.load(f);
+def load_furigana_data():
+    def build(index_file):
+        index = furigana_index.FuriganaIndex();
+        index.build_from_json(os.path.join(dicts_path, constants.FILE_JMDICT_JSON));
+        index.save(index_file);
+        return len(index);
+    def open_index(index_file):
+        index = furigana_index.FuriganaIndex();
+        index.load(index_file);
+        return index;
+    return load_artifact(constants.DATA_FURIGANA, os.path.join(dicts_path, constants.FILE_FURIGANA_INDEX),
+                         [os.path.join(dicts_path, constants.FILE_JMDICT_JSON)],
+                         f"furigana-{datafile.FORMAT_VERSION}-{furigana_index.INDEX_VERSION}", {}, build, open_index);
+
+# Processes for the dictionary and word index builds. A parallel build forks the Anki process, whose
+# Qt threads can leave a lock held in the child and deadlock it, so it's only done when the config asks.
+def build_workers():
+    return max(config.get(constants.SETTING_BUILD_WORKERS, 1), 1);
 
 # JMDict Data Load
-data_file = os.path.join(dicts_path, constants.FILE_JMDICT_PICKLE) # DIctionary LLoad?
-# Check to see if we already have a file
-if os.path.isfile(data_file):
-    # Open the pickle file and load the data
-    with open(data_file, 'rb') as file:
-        dict_data = pickle.load(file);
-else:
-    # No pickle file found, so we build the array and save for next time. This takes a few seconds.
-    jmdict_data = load_xml_file(os.path.join(dicts_path, constants.FILE_JMDICT_XML));
-    if jmdict_data is not None:
-        print(f"Successfully loaded XML file. Root tag is '{jmdict_data.tag}'.");
-    else:
-        print("Failed to load XML file.");
-    dict_data = build_dict_from_xml(jmdict_data);
-    jmdict_data = None;
-    with open(data_file, "wb") as file:
-        pickle.dump(dict_data, file);
+# The dictionary lives in a memory mapped index file, entries are only decoded when looked up
+def load_jmdict_data():
+    return load_artifact(constants.DATA_JMDICT, os.path.join(dicts_path, constants.FILE_JMDICT_INDEX),
+                         [os.path.join(dicts_path, constants.FILE_JMDICT_XML), os.path.join(dicts_path, constants.FILE_JMDICT_PICKLE)],
+                         f"jmdict-{datafile.FORMAT_VERSION}-{jmdict_index.INDEX_VERSION}", {}, build_jmdict_index, jmdict_index.JMdictIndex,
+                         lambda: data_loader.run(refresh_sentence_data));
+
+def build_jmdict_index(index_file):
+    xml_file = os.path.join(dicts_path, constants.FILE_JMDICT_XML);
+    pickle_file = os.path.join(dicts_path, constants.FILE_JMDICT_PICKLE);
+    if not os.path.isfile(xml_file):
+        if not os.path.isfile(pickle_file):
+            raise FileNotFoundError(f"Put {constants.FILE_JMDICT_XML} in {dicts_path} to build the dictionary from.");
+        # No XML around, convert the dict_data pickle left over from older versions instead
+        count = legacy_pickles.convert_jmdict_pickle(pickle_file, index_file);
+        print(f"Converted {constants.FILE_JMDICT_PICKLE} to a JMdict index with {count} words.");
+        return count;
+
+    # Stream the XML into the index. This takes a few seconds, less with build_workers set above 1.
+    def report_progress(count, fraction):
+        print(f"Building JMdict index: {count} entries ({fraction:.0%})");
+    count = jmdict_build.build_index(xml_file, index_file, report_progress, build_workers());
+    print(f"Successfully built JMdict index with {count} words.");
+    return count;
 
 # Begin Section for example sentences
-if os.path.isfile(os.path.join(dicts_path, constants.FILE_SENTENCES_PICKLE)):
-    jsl = sentence_examples.JapaneseSentenceLib();
-    jsl.load_pickle_file(os.path.join(dicts_path, constants.FILE_SENTENCES_PICKLE));
-else:
-    jsl = sentence_examples.JapaneseSentenceLib();
+def report_sentence_progress(rows, kept, rows_per_second):
+    print(f"Sentences: {rows} rows read, {kept} kept, {rows_per_second:.0f} rows/s");
+
+def report_word_index_progress(count, fraction):
+    print(f"Indexing sentence words: {count} sentences ({fraction:.0%})");
 
+# The sentence file (or database) as load_artifact takes it:
+# (artifact file, sources, builder version, build config, build, open_artifact)
+def sentence_artifact():
     # Won't include these in the release... However... can be downloaded from the following.
     # https://tatoeba.org/en/downloads
-    jsl.load_sentences_from_file(os.path.join(dicts_path, 'translated_sentences.tsv'));
-    jsl.load_sentence_rating_data(os.path.join(dicts_path, 'users_sentences.csv'));
-    jsl.save_pickle_file(os.path.join(dicts_path, constants.FILE_SENTENCES_PICKLE));
-    
+    sentences_file = os.path.join(dicts_path, 'translated_sentences.tsv');
+    ratings_file = os.path.join(dicts_path, 'users_sentences.csv');
+    # Optional, for English translations of the sentences
+    links_file = os.path.join(dicts_path, 'links.csv');
+    translations_file = os.path.join(dicts_path, 'eng_sentences.tsv');
+    # Older versions kept the sentences and their ratings in a pickle, read when the TSV isn't there
+    pickle_file = os.path.join(dicts_path, constants.FILE_SENTENCES_PICKLE);
+    # The word index comes from segmenting against the JMdict index, so a new index means a rebuild.
+    # It's the index file that's listed rather than the XML: a stale one is still what gets read
+    # until its rebuild has been swapped in (see refresh_sentence_data).
+    sources = [sentences_file, ratings_file, links_file, translations_file, pickle_file, os.path.join(dicts_path, constants.FILE_JMDICT_INDEX)];
+    def read_sentences():
+        if os.path.isfile(sentences_file):
+            jsl = sentence_examples.JapaneseSentenceLib();
+            jsl.load_sentences_from_file(sentences_file, report_sentence_progress);
+            jsl.load_sentence_rating_data(ratings_file);
+        elif os.path.isfile(pickle_file):
+            jsl = legacy_pickles.read_sentences_pickle(pickle_file);
+            print(f"Converting {len(jsl)} sentences from {constants.FILE_SENTENCES_PICKLE}.");
+        else:
+            raise FileNotFoundError(f"Put translated_sentences.tsv and users_sentences.csv from https://tatoeba.org/en/downloads in {dicts_path} for example sentences.");
+        if os.path.isfile(links_file) and os.path.isfile(translations_file):
+            jsl.load_translations(links_file, translations_file);
+        jsl.compute_scores();
+        # The JMdict load runs before this one on the same thread, so it's finished by now
+        try:
+            data_loader.get(constants.DATA_JMDICT);
+        except Exception as inst:
+            print("No JMdict index, example sentences will be matched by substring only.");
+            print(inst);
+        else:
+            jsl.build_word_index(os.path.join(dicts_path, constants.FILE_JMDICT_INDEX), build_workers(), report_word_index_progress);
+        return jsl;
+
+    engine = config.get(constants.SETTING_SENTENCE_ENGINE, sentence_examples.ENGINE_COLUMNS);
+    if engine == sentence_examples.ENGINE_SQLITE and not sentence_db.fts5_available():
+        print("This SQLite has no FTS5 trigram support, keeping the sentences in columns instead.");
+        engine = sentence_examples.ENGINE_COLUMNS;
+    if engine == sentence_examples.ENGINE_SQLITE:
+        def build_database(db_file):
+            jsl = read_sentences();
+            sentence_db.SentenceDatabase.build(db_file, jsl);
+            return len(jsl);
+        return (os.path.join(dicts_path, constants.FILE_SENTENCES_DB), sources,
+                f"sentences-db-{sentence_db.DB_VERSION}-{sentence_examples.DATA_VERSION}-{jmdict_index.INDEX_VERSION}", {}, build_database, sentence_db.SentenceDatabase);
+
+    def build(data_file):
+        jsl = read_sentences();
+        jsl.build_index();
+        jsl.save_data_file(data_file);
+        return len(jsl);
+    def open_sentences(data_file):
+        jsl = sentence_examples.JapaneseSentenceLib();
+        jsl.load_data_file(data_file);
+        return jsl;
+    return (os.path.join(dicts_path, constants.FILE_SENTENCES_DATA), sources,
+            f"sentences-{datafile.FORMAT_VERSION}-{sentence_examples.DATA_VERSION}-{jmdict_index.INDEX_VERSION}", {}, build, open_sentences);
+
+def load_sentence_data():
+    return load_artifact(constants.DATA_SENTENCES, *sentence_artifact());
+
+# Runs on the worker thread once a rebuilt JMdict index has been swapped in, the loaded
+# sentences' word index having been built from the old one
+def refresh_sentence_data():
+    if not load_available(constants.DATA_SENTENCES):
+        return;
+    artifact = sentence_artifact();
+    if artifacts.check_artifact(*artifact[:4]) == artifacts.STALE:
+        refresh_artifact(constants.DATA_SENTENCES, *artifact);
+
+# Word field of every note, for preferring example sentences made of words the user already has
+def load_known_words():
+    known = known_words.KnownWords();
+    known.build(aqt.mw.col, config.get(constants.SETTING_SRC_FIELD, ""));
+    return known;
+
+# The known words come from the open profile's collection. They're forgotten when it closes (waiting
+# for their load if it's reading the collection right then) so the next profile reads its own, and
+# the loads that haven't started yet are cancelled, to run again once a profile is open.
+def on_profile_will_close():
+    data_loader.reset(constants.DATA_KNOWN_WORDS);
+    data_loader.shutdown();
+
+# Nothing is loaded at import time, the loads run on a worker thread once the profile is open
+data_loader = loader.DataLoader();
+data_loader.register(constants.DATA_FURIGANA, load_furigana_data);
+data_loader.register(constants.DATA_JMDICT, load_jmdict_data);
+data_loader.register(constants.DATA_SENTENCES, load_sentence_data);
+
 # TODO Load nhk pronunciation dictionary
 # Create config variable
 config = aqt.mw.addonManager.getConfig(__name__);
 
+diagnostics.load_timings.set_log_file(os.path.join(os.path.dirname(__file__), constants.DIR_USER_FILES, constants.FILE_LOAD_TIMINGS_LOG));
+
 # Add the options to the menu
-init_menu();
+with diagnostics.load_timings.phase("startup: init menus"):
+    init_menu();
+set_known_words_enabled(config.get(constants.SETTING_PREFER_KNOWN_WORDS, False));
+
+aqt.gui_hooks.profile_did_open.append(data_loader.start);
+aqt.gui_hooks.profile_will_close.append(on_profile_will_close);
+
+diagnostics.load_timings.end(import_phase);
@@ -0,0 +1,80 @@
+import collections
+import re
+
+from . import diagnostics
+
+# The words the user already has notes for: the configured word field of every note.
+# Built in one pass over the notes table, then kept up to date as notes are added and edited.
+# Words are counted per note, so editing or deleting a note only forgets its word when no other note has it.
+
+# Separates the fields in notes.flds
+FIELD_SEPARATOR = "\x1f"
+
+HTML_TAG = re.compile(r"<[^>]*>")
+
+# A field's text as a word, without markup or surrounding whitespace
+def clean(text):
+    return HTML_TAG.sub("", text).replace("&nbsp;", " ").strip()
+
+class KnownWords:
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.note_words = {}
+        # Bumped on every change so whatever has been worked out from the words can be refreshed
+        self.version = 0
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __contains__(self, word):
+        return word in self.counts
+
+    def words(self):
+        return self.counts.keys()
+
+    # Reads field_name from every note in the collection whose note type has it, straight from
+    # the notes table rather than loading each note
+    def build(self, col, field_name):
+        with diagnostics.load_timings.phase("known words: build") as phase:
+            self.counts.clear()
+            self.note_words.clear()
+            for model in col.models.all():
+                ords = [field["ord"] for field in model["flds"] if field["name"] == field_name]
+                if not ords:
+                    continue
+                for note_id, flds in col.db.all("SELECT id, flds FROM notes WHERE mid = ?", model["id"]):
+                    fields = flds.split(FIELD_SEPARATOR)
+                    if ords[0] < len(fields):
+                        self.set_word(note_id, fields[ords[0]])
+            self.version += 1
+            phase.items = len(self.counts)
+
+    # Records the word field of a note that has been added or edited
+    def set_word(self, note_id, text):
+        word = clean(text)
+        previous = self.note_words.get(note_id)
+        if previous == word:
+            return
+        if previous is not None:
+            self.forget(previous)
+        if word:
+            self.note_words[note_id] = word
+            self.counts[word] += 1
+        else:
+            self.note_words.pop(note_id, None)
+        self.version += 1
+
+    def remove_notes(self, note_ids):
+        removed = False
+        for note_id in note_ids:
+            word = self.note_words.pop(note_id, None)
+            if word is not None:
+                self.forget(word)
+                removed = True
+        if removed:
+            self.version += 1
+
+    def forget(self, word):
+        self.counts[word] -= 1
+        if self.counts[word] <= 0:
+            del self.counts[word]
@@ -0,0 +1,72 @@
+import codecs
+import copyreg
+import datetime
+import pickle
+
+from . import jmdict_index
+from . import sentence_examples
+
+# One time conversion of the pickles older versions kept in dicts/ (dill.pkl and sentences.pickle),
+# for installs that have them but not the XML/TSV files to build from.
+# Unpickling can normally run any code the file names, so these are read with an unpickler that only
+# creates plain containers, strings, numbers, datetimes and attribute holders for the old Sentence objects.
+
+class LegacySentence:
+    pass
+
+# (module, name) pairs the old pickles may refer to, anything else fails to load.
+# Protocols 0 and 1 write the Python 2 module names, and datetimes' bytes through _codecs.encode.
+ALLOWED_GLOBALS = {
+    ("_codecs", "encode"): codecs.encode,
+    ("datetime", "datetime"): datetime.datetime,
+    ("copyreg", "_reconstructor"): copyreg._reconstructor,
+    ("copy_reg", "_reconstructor"): copyreg._reconstructor,
+    ("builtins", "object"): object,
+    ("__builtin__", "object"): object,
+}
+
+class RestrictedUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        # The module of the old Sentence class depends on the folder the add-on was installed in
+        if name == "Sentence" and module.split(".")[-1] == "sentence_examples":
+            return LegacySentence
+        value = ALLOWED_GLOBALS.get((module, name))
+        if value is None:
+            raise pickle.UnpicklingError(f"{module}.{name} isn't allowed in a dictionary pickle")
+        return value
+
+def load(filepath):
+    with open(filepath, 'rb') as file:
+        return RestrictedUnpickler(file).load()
+
+# dict_data maps each keb to {"reb": ..., "parts_of_speech_values": "pos; pos", "senses": {1: "1: gloss; gloss", ...}}
+def entry_from_dict(item, keb):
+    pos = tuple(item["parts_of_speech_values"].split('; ')) if item["parts_of_speech_values"] else ()
+    senses = tuple(tuple(item["senses"][i].split(': ', 1)[1].split('; ')) for i in sorted(item["senses"]))
+    return jmdict_index.JMdictEntry(item["reb"], pos, senses, keb=keb)
+
+# Writes the entries of dill.pkl to a JMdict index, returns how many there were
+def convert_jmdict_pickle(pickle_path, index_path):
+    dict_data = load(pickle_path)
+    writer = jmdict_index.IndexWriter(index_path)
+    for key, item in dict_data.items():
+        entry = entry_from_dict(item, key)
+        writer.add(entry, [(key, jmdict_index.NO_PRIORITY)], [(entry.reb, jmdict_index.NO_PRIORITY)])
+    writer.finish()
+    return len(dict_data)
+
+# A JapaneseSentenceLib holding the Japanese sentences of sentences.pickle and their ratings.
+# The pickle has every language Tatoeba exported, the others are left out as they are from the TSV.
+def read_sentences_pickle(pickle_path):
+    sentences = [sentence for sentence in load(pickle_path).values() if getattr(sentence, "lang", None) == sentence_examples.SENTENCE_LANGUAGE]
+    jsl = sentence_examples.JapaneseSentenceLib()
+    jsl.add_sentences([[sentence.id, sentence.lang, sentence.text, "",
+                        sentence.date_added.strftime('%Y-%m-%d %H:%M:%S'), sentence.date_modified.strftime('%Y-%m-%d %H:%M:%S')]
+                       for sentence in sentences])
+    jsl.sort_by_id()
+    for sentence in sentences:
+        position = jsl.position_of(int(sentence.id))
+        jsl.total[position] = sentence.total_ratings
+        jsl.positive[position] = sentence.positive_rating
+        jsl.negative[position] = sentence.negative_rating
+    return jsl
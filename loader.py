@@ -0,0 +1,150 @@
+import concurrent.futures
+import queue
+import threading
+
+# A single daemon thread running submitted calls in order. A ThreadPoolExecutor's threads are
+# joined when the interpreter exits, so quitting Anki would wait out a build that can take minutes.
+# This one is abandoned instead; builds write to temporary files that are only renamed into place
+# once complete (see artifacts), so nothing half written is left to load next time.
+class Worker:
+    def __init__(self, name):
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, func):
+        future = concurrent.futures.Future()
+        self.queue.put((future, func))
+        return future
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            future, func = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = func()
+            except BaseException as inst:
+                future.set_exception(inst)
+            else:
+                future.set_result(result)
+
+    # Cancels the calls that haven't started, the thread exits once the running one returns
+    def shutdown(self):
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[0].cancel()
+        self.queue.put(None)
+
+# Runs the expensive data loads (dictionaries, sentence library) on a single
+# worker thread so that importing the add-on doesn't block Anki startup.
+# Each registered load gets a future that callers can poll or wait on.
+class DataLoader:
+    def __init__(self):
+        self.tasks = {}
+        self.futures = {}
+        self.executor = None
+        self.lock = threading.Lock()
+
+    # Registers a load function under a name, it is not run until start()
+    def register(self, name, func):
+        with self.lock:
+            self.tasks[name] = func
+
+    # Submits every registered load that hasn't been started yet.
+    # Safe to call more than once, e.g. from profile_did_open on every profile switch.
+    def start(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = Worker("auto_japanese_loader")
+            for name, func in self.tasks.items():
+                if name not in self.futures:
+                    self.futures[name] = self.executor.submit(func)
+
+    def future(self, name):
+        if name not in self.futures:
+            self.start()
+        return self.futures[name]
+
+    # True once the named loads (or every load, when no names are given) have finished,
+    # whether they succeeded or not, see failed()
+    def is_ready(self, *names):
+        names = names or list(self.tasks)
+        return all(n in self.futures and self.futures[n].done() for n in names)
+
+    # The exception a finished load raised, None while it's running or when it succeeded
+    def error(self, name):
+        future = self.futures.get(name)
+        if future is None or not future.done() or future.cancelled():
+            return None
+        return future.exception()
+
+    def failed(self, name):
+        return self.error(name) is not None
+
+    # Returns the loaded value, blocking until it's available.
+    # Re-raises any exception raised by the load function.
+    def get(self, name, timeout=None):
+        return self.future(name).result(timeout)
+
+    # Swaps in a new value for a load, e.g. once a stale file has been rebuilt
+    def replace(self, name, value):
+        future = concurrent.futures.Future()
+        future.set_result(value)
+        with self.lock:
+            self.futures[name] = future
+
+    # Runs build on the worker thread after the pending loads and hands its result to install.
+    # Whatever is currently loaded keeps being served in the meantime.
+    def refresh(self, name, build, install):
+        def on_done(future):
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                print(f"Failed to rebuild {name}:")
+                print(future.exception())
+                return
+            install(future.result())
+        self.start()
+        self.executor.submit(build).add_done_callback(on_done)
+
+    # Runs func on the worker thread after whatever is queued there
+    def run(self, func):
+        self.start()
+        return self.executor.submit(func)
+
+    # Blocks until every load has finished
+    def wait(self, timeout=None):
+        self.start()
+        concurrent.futures.wait(list(self.futures.values()), timeout)
+
+    # Forgets a load so the next start() runs it again, e.g. one that read from a profile that's
+    # being closed. When it's already running this waits for it, so it's done reading.
+    def reset(self, name):
+        with self.lock:
+            future = self.futures.pop(name, None)
+        if future is not None and not future.cancel():
+            concurrent.futures.wait([future])
+
+    # Drops a load altogether, see reset()
+    def unregister(self, name):
+        with self.lock:
+            self.tasks.pop(name, None)
+        self.reset(name)
+
+    # Cancels the loads that haven't started, they're run again by the next start()
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+            for name, future in list(self.futures.items()):
+                if future.cancelled():
+                    del self.futures[name]
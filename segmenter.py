@@ -0,0 +1,120 @@
+from . import deinflect
+from . import wanakana
+
+# Splits a sentence into dictionary words by longest match, left to right.
+# The JMdict index keeps its keys sorted, so the keys starting with text[i:j] form one
+# range and growing j only narrows it. At each position we extend the match one character
+# at a time until the range is empty, which costs a couple of binary searches per character.
+# When a word is followed by kana the deinflector gets a chance at the longer, conjugated
+# form (食べました), so a sentence takes time roughly linear in its length.
+
+# Longest conjugation tail tried after the dictionary match, e.g. させられませんでした
+MAX_INFLECTION_LENGTH = 10
+
+# One piece of a segmented sentence.
+# text: the text as it appears in the sentence, start/end: its position there,
+# term: the dictionary form it was found under, entry: the JMdictEntry (None for text that
+# isn't in the dictionary), reasons: conjugations undone to get from text to term
+class Segment:
+    __slots__ = ("text", "start", "end", "term", "entry", "reasons")
+
+    def __init__(self, text, start, end, term=None, entry=None, reasons=()):
+        self.text = text
+        self.start = start
+        self.end = end
+        self.term = text if term is None else term
+        self.entry = entry
+        self.reasons = reasons
+
+    def __repr__(self):
+        return f"Segment({self.text!r}, {self.start}, {self.end}, {self.term!r})"
+
+    # Reading of the text as it appears, the entry's reading with the conjugated tail swapped
+    # in, e.g. 食べました with 食べる/たべる gives たべました
+    @property
+    def reading(self):
+        if self.entry is None:
+            return self.text
+        reading = self.entry.reading_for(self.term)
+        if self.term == self.text:
+            return reading
+        common = common_prefix_length(self.term, self.text)
+        tail = len(self.term) - common
+        if not reading.endswith(self.term[common:]):
+            return self.text
+        return reading[:len(reading) - tail] + self.text[common:]
+
+def common_prefix_length(first, second):
+    length = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        length += 1
+    return length
+
+# Returns (length, reach, key position): the length of the longest key in table that text
+# has at position and that key's position in the table, and how far text[position:] is
+# still the prefix of some key. Matching stops at the table's longest key, so long kana
+# runs don't keep it searching.
+def longest_key(table, text, position):
+    low, high = 0, len(table)
+    longest = 0
+    reach = 0
+    key_position = -1
+    for end in range(position + 1, min(len(text), position + table.longest) + 1):
+        prefix = text[position:end]
+        low, high = table.prefix_range(prefix, low, high)
+        if low >= high:
+            break
+        reach = end - position
+        # A key equal to the prefix sorts before everything else starting with it
+        if table.key_at(low) == prefix:
+            longest = reach
+            key_position = low
+    return longest, reach, key_position
+
+def segment(index, text):
+    segments = []
+    position = 0
+    while position < len(text):
+        found = match_at(index, text, position)
+        if found is None:
+            # Not a dictionary word, glue it onto the unknown text before it
+            if segments and segments[-1].entry is None:
+                previous = segments[-1]
+                segments[-1] = Segment(previous.text + text[position], previous.start, position + 1)
+            else:
+                segments.append(Segment(text[position], position, position + 1))
+            position += 1
+            continue
+        segments.append(found)
+        position = found.end
+    return segments
+
+# The longest dictionary word starting at position, None when there isn't one
+def match_at(index, text, position):
+    best = None
+    reach = 0
+    for table in (index.headwords, index.readings):
+        length, table_reach, key_position = longest_key(table, text, position)
+        reach = max(reach, table_reach)
+        if length and (best is None or length > best.end - best.start):
+            term = text[position:position + length]
+            entry = index.record(table.records(key_position)[0])
+            best = Segment(term, position, position + length, term, entry)
+
+    # A conjugated word is a (partial) key followed by kana, try the longest of those first
+    longest = best.end - position if best else 0
+    tail_end = position + reach
+    while tail_end < len(text) and tail_end - position - reach < MAX_INFLECTION_LENGTH and wanakana.is_hiragana(text[tail_end]):
+        tail_end += 1
+    for end in range(tail_end, position + longest, -1):
+        surface = text[position:end]
+        for match in deinflect.lookup(index, surface):
+            if match.reasons:
+                return Segment(surface, position, end, match.term, match.entry, match.reasons)
+    return best
+
+# Only the segments that are dictionary words
+def words(index, text):
+    return [piece for piece in segment(index, text) if piece.entry is not None]
@@ -0,0 +1,179 @@
+import collections
+import os
+import sqlite3
+import threading
+
+from . import diagnostics
+from . import sentence_examples
+
+# Example sentences kept in an SQLite database with an FTS5 trigram index, an alternative to the
+# memory mapped columns of sentence_examples. Nothing but the query results is read into the
+# process: a word of three or more characters is a phrase match on the trigram index, shorter
+# ones walk the sentences in ranking order (there's an index for each) until enough have matched.
+# Words in the word index (see JapaneseSentenceLib.build_word_index) are looked up there instead.
+# Results are the same as JapaneseSentenceLib's, ties broken by sentence id.
+
+# Bump when the schema changes, checked against PRAGMA user_version on open
+DB_VERSION = 3
+
+# Trigram matching can't look up fewer characters than this
+TRIGRAM_LENGTH = 3
+
+SCHEMA = """
+CREATE TABLE sentences (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    added INTEGER NOT NULL,
+    modified INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    positive INTEGER NOT NULL,
+    negative INTEGER NOT NULL,
+    score REAL NOT NULL
+);
+CREATE INDEX sentences_by_score ON sentences (score, id);
+CREATE INDEX sentences_by_date ON sentences (added, id);
+CREATE TABLE words (
+    word TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    PRIMARY KEY (word, id)
+) WITHOUT ROWID;
+CREATE INDEX words_by_sentence ON words (id);
+CREATE VIRTUAL TABLE sentences_fts USING fts5 (text, content='sentences', content_rowid='id', tokenize='trigram case_sensitive 1');
+"""
+
+COLUMNS = "s.id, s.text, s.translation, s.added, s.modified, s.total, s.positive, s.negative, s.score"
+
+ORDER_BY = {
+    sentence_examples.RANK_BY_DATE: "s.added, s.id",
+    sentence_examples.RANK_BY_SCORE: "s.score, s.id",
+}
+
+# Whether this Python's SQLite has FTS5 with the trigram tokenizer (SQLite 3.34 and later)
+def fts5_available():
+    try:
+        connection = sqlite3.connect(":memory:")
+        try:
+            connection.execute("CREATE VIRTUAL TABLE probe USING fts5 (text, tokenize='trigram case_sensitive 1')")
+        finally:
+            connection.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+# Quoted as a single FTS5 phrase, so nothing in the word is taken as query syntax
+def phrase(word):
+    return '"' + word.replace('"', '""') + '"'
+
+# One sentence read from the database, with the same attributes as sentence_examples.Sentence
+class StoredSentence:
+    __slots__ = ("id", "text", "translation", "added", "modified", "total_ratings", "positive_rating", "negative_rating", "score")
+
+    def __init__(self, row):
+        (sentence_id, self.text, self.translation, self.added, self.modified,
+         self.total_ratings, self.positive_rating, self.negative_rating, self.score) = row
+        self.id = str(sentence_id)
+
+    @property
+    def date_added(self):
+        return sentence_examples.to_datetime(self.added)
+
+    @property
+    def date_modified(self):
+        return sentence_examples.to_datetime(self.modified)
+
+    def get_rating_percentage(self):
+        if self.total_ratings == 0:
+            return 100
+        return self.positive_rating / self.total_ratings * 100
+
+class SentenceDatabase:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        # Opened on the loader thread and queried from the main one, the lock keeps that to one at a time
+        self.connection = sqlite3.connect(f"file:{filepath}?mode=ro", uri=True, check_same_thread=False)
+        self.lock = threading.Lock()
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != DB_VERSION:
+            self.connection.close()
+            raise sqlite3.DatabaseError(f"{filepath} is version {version}, expected {DB_VERSION}")
+        self.count = self.connection.execute("SELECT count(*) FROM sentences").fetchone()[0]
+        # Only built when the dictionary was there, see JapaneseSentenceLib.build_word_index
+        self.has_words = self.connection.execute("SELECT 1 FROM words LIMIT 1").fetchone() is not None
+
+    def __len__(self):
+        return self.count
+
+    # Writes the sentences of a loaded JapaneseSentenceLib (scores computed) to a new database
+    @staticmethod
+    def build(filepath, lib):
+        with diagnostics.load_timings.phase("sentences: build database") as phase:
+            # Start from nothing, not a database left behind by an interrupted build
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            connection = sqlite3.connect(filepath)
+            try:
+                connection.execute("PRAGMA journal_mode = OFF")
+                connection.execute("PRAGMA synchronous = OFF")
+                connection.executescript(SCHEMA)
+                with connection:
+                    connection.executemany("INSERT INTO sentences VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                           ((lib.ids[position], lib.text_at(position), lib.translation_at(position),
+                                             lib.added[position], lib.modified[position], lib.total[position],
+                                             lib.positive[position], lib.negative[position], lib.score[position])
+                                            for position in range(len(lib))))
+                    connection.execute("INSERT INTO sentences_fts (sentences_fts) VALUES ('rebuild')")
+                    if lib.words is not None:
+                        connection.executemany("INSERT INTO words VALUES (?, ?)",
+                                               ((lib.words.key_at(key), lib.ids[position])
+                                                for key in range(len(lib.words)) for position in lib.words.records(key)))
+                connection.execute(f"PRAGMA user_version = {DB_VERSION}")
+                connection.execute("PRAGMA optimize")
+            finally:
+                connection.close()
+            phase.items = len(lib)
+
+    # known and dictionary work as in JapaneseSentenceLib.find_example_sentences_by_word
+    def find_example_sentences_by_word(self, word, limit = 10, ranking = sentence_examples.RANK_BY_DATE, known = None, dictionary = None):
+        if not word or limit <= 0:
+            return []
+        wanted = limit if known is None else max(limit, sentence_examples.LEARNER_CANDIDATES)
+        order = ORDER_BY.get(ranking, ORDER_BY[sentence_examples.RANK_BY_DATE])
+        with self.lock:
+            in_words = self.connection.execute("SELECT 1 FROM words WHERE word = ? LIMIT 1", (word,)).fetchone()
+        if in_words:
+            query = f"SELECT {COLUMNS} FROM words w JOIN sentences s ON s.id = w.id WHERE w.word = ? ORDER BY {order} LIMIT ?"
+            parameters = (word, wanted)
+        elif self.has_words and dictionary is not None and word in dictionary:
+            return []
+        elif len(word) >= TRIGRAM_LENGTH:
+            query = (f"SELECT {COLUMNS} FROM sentences_fts JOIN sentences s ON s.id = sentences_fts.rowid "
+                     f"WHERE sentences_fts MATCH ? ORDER BY {order} LIMIT ?")
+            parameters = (phrase(word), wanted)
+        else:
+            query = f"SELECT {COLUMNS} FROM sentences s WHERE instr(s.text, ?) > 0 ORDER BY {order} LIMIT ?"
+            parameters = (word, wanted)
+        with self.lock:
+            rows = self.connection.execute(query, parameters).fetchall()
+            if known is not None and rows:
+                unknown = collections.Counter()
+                ids = [row[0] for row in rows]
+                for sentence_id, other in self.connection.execute(
+                        f"SELECT id, word FROM words WHERE id IN ({','.join('?' * len(ids))})", ids):
+                    if other != word and other not in known:
+                        unknown[sentence_id] += 1
+                # sorted() is stable, so sentences with as many unknown words keep their ranking order
+                rows = sorted(rows, key=lambda row: unknown[row[0]])
+        return [StoredSentence(row) for row in rows[:limit]]
+
+    def find_example_sentences_by_word_formatted(self, word, limit = 10, ranking = sentence_examples.RANK_BY_DATE, translations = False, known = None, dictionary = None):
+        return sentence_examples.format_sentences(self.find_example_sentences_by_word(word, limit, ranking, known, dictionary), translations)
+
+    def get_sentence_by_id(self, id):
+        with self.lock:
+            row = self.connection.execute(f"SELECT {COLUMNS} FROM sentences s WHERE s.id = ?", (int(id),)).fetchone()
+        return StoredSentence(row) if row else None
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
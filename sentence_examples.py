@@ -1,42 +1,376 @@
+import bisect
+import calendar
+import collections
+import concurrent.futures
 import csv
-import pickle
-from datetime import datetime
+import heapq
+import time
+from array import array
+from datetime import datetime, timedelta
 
+from . import datafile
+from . import diagnostics
+from . import jmdict_build
+from . import jmdict_index
+from . import segmenter
+from . import sentence_index
+
+# Bump when the data file changes shape so existing files get rebuilt
+DATA_VERSION = 8
+
+# How example sentences are picked: the oldest ones, or by Sentence.score
+RANK_BY_DATE = "date"
+RANK_BY_SCORE = "score"
+
+# Where they're kept: these columns, or the SQLite database of sentence_db
+ENGINE_COLUMNS = "columns"
+ENGINE_SQLITE = "sqlite"
+
+# Sentence.score weights, each part runs from 0 (best) to 1
+SCORE_RATING_WEIGHT = 0.5 # share of ratings that aren't positive
+SCORE_LENGTH_WEIGHT = 0.3 # distance from SCORE_IDEAL_LENGTH
+SCORE_DATE_WEIGHT = 0.2 # how recently it was added, older sentences have had more review
+SCORE_IDEAL_LENGTH = 15
+SCORE_FIRST_DATE = datetime(2006, 1, 1)
+SCORE_DATE_SPAN = 20 * 365 * 24 * 3600
+
+# Used for sentences that have no usable date at all
+DEFAULT_DATE = '2008-01-26 18:04:24'
+EPOCH = datetime(1970, 1, 1)
+
+# Only these rows of the Tatoeba export are kept
+SENTENCE_LANGUAGE = "jpn"
+
+# Translations are joined in from this language and shown after the sentence, "JP — EN"
+TRANSLATION_LANGUAGE = "eng"
+TRANSLATION_SEPARATOR = " — "
+
+# Rows are appended to the columns this many at a time
+SENTENCE_CHUNK_ROWS = 20000
+
+# The progress callback is called every this many rows read
+SENTENCE_PROGRESS_ROWS = 200000
+
+# Sentences segmented per job when building the word index
+WORD_INDEX_CHUNK = 2000
+
+# Sections of the word index in the data file, a jmdict_index.KeyTable
+WORD_TABLE = "words"
+
+# When preferring sentences with known words, this many of the best ranked matches are looked at
+LEARNER_CANDIDATES = 1000
+
+# SentenceAllocator looks at this many candidates per sentence a note gets
+ALLOCATOR_CANDIDATES_PER_SENTENCE = 4
+
+# and counts a sentence that has already gone to another note as this many places further down
+REUSE_PENALTY = 2
+
+# Seconds since the epoch for each day seen, there are only a few thousand of them
+_day_starts = {}
+
+# Tatoeba dates ("2008-01-26 18:04:24") as seconds since the epoch.
+# The format is fixed, so the fields are sliced out rather than going through strptime.
+def parse_date(value):
+    day = value[:10]
+    start = _day_starts.get(day)
+    if start is None:
+        start = calendar.timegm((int(value[0:4]), int(value[5:7]), int(value[8:10]), 0, 0, 0))
+        _day_starts[day] = start
+    return start + int(value[11:13]) * 3600 + int(value[14:16]) * 60 + int(value[17:19])
+
+def to_datetime(timestamp):
+    return EPOCH + timedelta(seconds=timestamp)
+
+# The sentences are held column by column rather than as one object each:
+#   ids        Tatoeba sentence id, ascending
+#   added      date added, seconds since the epoch
+#   modified   date last modified, likewise
+#   total/positive/negative   rating counts
+#   score      static ranking score (see Sentence.compute_score)
+#   text       all the texts as one UTF-8 buffer, text_offsets[i] to text_offsets[i + 1] per sentence
+#   translations   the English translations the same way, empty for sentences without one
+# and two indexes over the texts: the bigram index for substrings and the word index, from
+# the dictionary form of each word to the sentences it's in. Alongside the word index,
+# sentence_words lists the words of each sentence (as positions in the word index),
+# sentence_word_offsets[i] to sentence_word_offsets[i + 1] per sentence.
+# Sentences are addressed by their position in the columns. The saved file is a data file
+# that's memory mapped on load, so only the pages that are looked at are ever read in.
 class JapaneseSentenceLib:
     def __init__(self):
-        self.sentences = {}
+        self.ids = array('I')
+        self.added = array('q')
+        self.modified = array('q')
+        self.total = array('I')
+        self.positive = array('I')
+        self.negative = array('I')
+        self.score = array('d')
+        self.text_offsets = array('I', [0])
+        self.text = bytearray()
+        self.translation_offsets = array('I', [0])
+        self.translations = bytearray()
+        self.index = None
+        self.words = None
+        self.word_sections = {}
+        self.sentence_word_offsets = None
+        self.sentence_words = None
+        self.known_keys = (None, None)
+        self.data = None
+
+    def __len__(self):
+        return len(self.ids)
 
     # Data locations...
     # Sentence id [tab] Lang [tab] Text [tab] Username [tab] Date added [tab] Date last modified
-    def load_sentences_from_file(self, filepath):
-        with open(filepath, 'r') as file:
-            reader = csv.reader(file, delimiter='\t')
-            for line in reader:
-                add_sentence = Sentence(line)
-                self.sentences[int(add_sentence.id)] = add_sentence
-
-    def find_example_sentences_by_word(self, word, limit = 10):
-        sentences = []
-        for sentence in self.sentences.values():
-            if word in sentence.text:
-                sentences.append(sentence)
-
-        sentences = sorted(sentences, key=lambda x: x.date_added)
-        if len(sentences) > limit:
-            return sentences[:limit]
-        return sentences
-
-    def find_example_sentences_by_word_formatted(self, word, limit = 10):
-        sentences = self.find_example_sentences_by_word(word, limit)
-        output_str_ary = []
-        for sentence in sentences:
-            output_str_ary.append(sentence.text)
-        return "<br>".join(output_str_ary)
+    # Streams the file, keeping only the Japanese rows and appending them to the columns a
+    # chunk at a time. progress, when given, is called as progress(rows read, rows kept, rows/s).
+    def load_sentences_from_file(self, filepath, progress=None):
+        with diagnostics.load_timings.phase("sentences: read TSV") as phase, open(filepath, 'r', encoding='utf-8', newline='') as file:
+            started = time.perf_counter()
+            rows = 0
+            chunk = []
+            for line in file:
+                rows += 1
+                if rows % SENTENCE_PROGRESS_ROWS == 0 and progress:
+                    progress(rows, len(self.ids) + len(chunk), rows / max(time.perf_counter() - started, 1e-9))
+                fields = line.rstrip('\r\n').split('\t')
+                if len(fields) < 3 or fields[1] != SENTENCE_LANGUAGE:
+                    continue
+                chunk.append(fields)
+                if len(chunk) == SENTENCE_CHUNK_ROWS:
+                    self.add_sentences(chunk)
+                    chunk = []
+            self.add_sentences(chunk)
+            # The export is in id order already, but don't rely on it
+            self.sort_by_id()
+            if progress:
+                progress(rows, len(self.ids), rows / max(time.perf_counter() - started, 1e-9))
+            phase.items = rows
+
+    # Appends a chunk of split TSV rows
+    def add_sentences(self, rows):
+        texts = []
+        end = self.text_offsets[-1]
+        for fields in rows:
+            text = fields[2].encode('utf-8')
+            added, modified = fix_dates(fields[4] if len(fields) > 4 else '\\N', fields[5] if len(fields) > 5 else '\\N')
+            self.ids.append(int(fields[0]))
+            self.added.append(added)
+            self.modified.append(modified)
+            texts.append(text)
+            end += len(text)
+            self.text_offsets.append(end)
+        self.text += b''.join(texts)
+        zeros = [0] * len(rows)
+        self.total.extend(zeros)
+        self.positive.extend(zeros)
+        self.negative.extend(zeros)
+        self.score.extend(zeros)
+
+    # Puts the columns in id order, position_of needs it
+    def sort_by_id(self):
+        ids = self.ids
+        if all(ids[i] < ids[i + 1] for i in range(len(ids) - 1)):
+            return
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        for name in ("ids", "added", "modified", "total", "positive", "negative", "score"):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, [column[i] for i in order]))
+        text = bytearray()
+        offsets = array('I', [0])
+        for i in order:
+            text += self.text[self.text_offsets[i]:self.text_offsets[i + 1]]
+            offsets.append(len(text))
+        self.text = text
+        self.text_offsets = offsets
+
+    def text_at(self, position):
+        return bytes(self.text[self.text_offsets[position]:self.text_offsets[position + 1]]).decode('utf-8')
+
+    # Empty until load_translations has run
+    def translation_at(self, position):
+        if position + 1 >= len(self.translation_offsets):
+            return ""
+        return bytes(self.translations[self.translation_offsets[position]:self.translation_offsets[position + 1]]).decode('utf-8')
+
+    # Links file: Sentence id [tab] Translation id (both directions are listed)
+    # Translations file: Sentence id [tab] Lang [tab] Text, like the sentences file
+    # A hash join against the sentence ids, streaming both files: only the links from one of our
+    # sentences are kept, then only the translations those links point to. Each sentence gets
+    # its lowest numbered translation. Run after the sentences are loaded.
+    def load_translations(self, links_file, translations_file):
+        with diagnostics.load_timings.phase("sentences: join translations") as phase:
+            positions = dict(zip(self.ids, range(len(self.ids))))
+            wanted = {}
+            with open(links_file, 'r', encoding='utf-8', newline='') as file:
+                for line in file:
+                    fields = line.split('\t')
+                    if len(fields) < 2:
+                        continue
+                    position = positions.get(int(fields[0]))
+                    if position is not None:
+                        wanted.setdefault(int(fields[1]), []).append(position)
+            del positions
+
+            found = {}
+            with open(translations_file, 'r', encoding='utf-8', newline='') as file:
+                for line in file:
+                    fields = line.rstrip('\r\n').split('\t')
+                    if len(fields) < 3 or fields[1] != TRANSLATION_LANGUAGE:
+                        continue
+                    translation_id = int(fields[0])
+                    for position in wanted.get(translation_id, ()):
+                        previous = found.get(position)
+                        if previous is None or translation_id < previous[0]:
+                            found[position] = (translation_id, fields[2])
+
+            self.translation_offsets = array('I', [0])
+            self.translations = bytearray()
+            for position in range(len(self.ids)):
+                if position in found:
+                    self.translations += found[position][1].encode('utf-8')
+                self.translation_offsets.append(len(self.translations))
+            phase.items = len(found)
+
+    # Position of a sentence id in the columns, -1 when it isn't there
+    def position_of(self, sentence_id):
+        position = bisect.bisect_left(self.ids, sentence_id)
+        if position < len(self.ids) and self.ids[position] == sentence_id:
+            return position
+        return -1
+
+    # Scores every sentence once, after the ratings are in. Saved with the sentences.
+    def compute_scores(self):
+        for position in range(len(self.ids)):
+            self.score[position] = Sentence(self, position).compute_score()
+
+    # Bigram index over the sentence texts, saved with the sentences
+    def build_index(self):
+        with diagnostics.load_timings.phase("sentences: build bigram index") as phase:
+            self.index = sentence_index.BigramIndex.build((position, self.text_at(position)) for position in range(len(self.ids)))
+            phase.items = len(self.index)
+
+    # Word index from segmenting every sentence against the JMdict index at dictionary_path.
+    # Each word is recorded under its dictionary form (食べました under 食べる), once per sentence.
+    # With workers > 1 the sentences are segmented in a process pool, like jmdict_build does.
+    # progress, when given, is called as progress(sentences done, fraction done).
+    def build_word_index(self, dictionary_path, workers=1, progress=None):
+        with diagnostics.load_timings.phase("sentences: build word index") as phase:
+            writer = jmdict_index.KeyTableWriter(ranked=False)
+            # Each sentence's words by the order they were first seen in, renumbered to
+            # their position in the word index once the keys are sorted
+            word_ids = {}
+            sentence_word_offsets = array('I', [0])
+            sentence_words = array('I')
+            done = 0
+            def add_chunk(start, chunk_words):
+                nonlocal done
+                for offset, words in enumerate(chunk_words):
+                    for word in words:
+                        writer.add(word, start + offset)
+                        sentence_words.append(word_ids.setdefault(word, len(word_ids)))
+                    sentence_word_offsets.append(len(sentence_words))
+                done += len(chunk_words)
+                if progress:
+                    progress(done, done / max(len(self.ids), 1))
+
+            chunks = ((start, [self.text_at(position) for position in range(start, min(start + WORD_INDEX_CHUNK, len(self.ids)))])
+                      for start in range(0, len(self.ids), WORD_INDEX_CHUNK))
+            context = jmdict_build.parallel_context() if workers > 1 else None
+            if context is None:
+                _open_dictionary(dictionary_path)
+                try:
+                    for start, texts in chunks:
+                        add_chunk(start, _segment_texts(texts))
+                finally:
+                    _close_dictionary()
+            else:
+                # Chunks are merged in order so the postings come out sorted, only a few are in flight at once
+                with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                                            initializer=_open_dictionary, initargs=(dictionary_path,)) as executor:
+                    pending = collections.deque()
+                    for start, texts in chunks:
+                        pending.append((start, executor.submit(_segment_texts, texts)))
+                        if len(pending) >= workers * 2:
+                            start, future = pending.popleft()
+                            add_chunk(start, future.result())
+                    while pending:
+                        start, future = pending.popleft()
+                        add_chunk(start, future.result())
+
+            renumbered = array('I', bytes(4 * len(word_ids)))
+            for position, word in enumerate(sorted(word_ids, key=lambda word: word.encode('utf-8'))):
+                renumbered[word_ids[word]] = position
+            self.word_sections = writer.sections(WORD_TABLE)
+            self.word_sections["sword_offs"] = sentence_word_offsets
+            self.word_sections["sword_keys"] = array('I', (renumbered[word_id] for word_id in sentence_words))
+            self.words = jmdict_index.KeyTable(datafile.MemorySections(self.word_sections), WORD_TABLE)
+            self.sentence_word_offsets = self.word_sections["sword_offs"]
+            self.sentence_words = self.word_sections["sword_keys"]
+            self.known_keys = (None, None)
+            phase.items = len(writer)
+
+    # The known words (a known_words.KnownWords) as positions in the word index.
+    # Worked out again only when they've changed since the last call.
+    def known_word_keys(self, known):
+        version, keys = self.known_keys
+        if version != (id(known), known.version):
+            keys = {position for position in map(self.words.find, known.words()) if position >= 0}
+            self.known_keys = ((id(known), known.version), keys)
+        return keys
+
+    # How many words of the sentence at position, other than target (a word index position), aren't known
+    def unknown_words(self, position, known_keys, target):
+        count = 0
+        for key in self.sentence_words[self.sentence_word_offsets[position]:self.sentence_word_offsets[position + 1]]:
+            if key != target and key not in known_keys:
+                count += 1
+        return count
+
+    # Positions of the sentences the word is in, in id order. Exact when the word index has it,
+    # otherwise the sentences containing it as a substring. With dictionary (a JMdictIndex), a
+    # headword missing from the word index is in no sentence on its own, even though its text
+    # may be part of longer words (日 in 日本), so it isn't looked for as a substring.
+    def sentences_with_word(self, word, dictionary = None):
+        if self.words is not None:
+            position = self.words.find(word)
+            if position >= 0:
+                return self.words.records(position)
+            if dictionary is not None and word in dictionary:
+                return []
+        if self.index is None:
+            self.build_index()
+        # The bigram index narrows it down to sentences with all of the word's bigrams, then check the text
+        return (position for position in self.index.candidates(word) if word in self.text_at(position))
+
+    # With known (a known_words.KnownWords), sentences where every other word is already known
+    # come first (i+1 sentences), then those with one unknown word and so on, each in ranking order.
+    # dictionary works as in sentences_with_word.
+    def find_example_sentences_by_word(self, word, limit = 10, ranking = RANK_BY_DATE, known = None, dictionary = None):
+        matches = self.sentences_with_word(word, dictionary)
+
+        # Keep only the best limit in a heap rather than sorting every match.
+        # Matches come in id order, which breaks ties.
+        rank = self.score.__getitem__ if ranking == RANK_BY_SCORE else self.added.__getitem__
+        if known is None or self.sentence_words is None:
+            best = heapq.nsmallest(limit, matches, key=rank)
+        else:
+            # nsmallest is stable, so sentences with as many unknown words keep their ranking order
+            ranked = heapq.nsmallest(LEARNER_CANDIDATES, matches, key=rank)
+            known_keys = self.known_word_keys(known)
+            target = self.words.find(word)
+            best = heapq.nsmallest(limit, ranked, key=lambda position: self.unknown_words(position, known_keys, target))
+        return [Sentence(self, position) for position in best]
+
+    def find_example_sentences_by_word_formatted(self, word, limit = 10, ranking = RANK_BY_DATE, translations = False, known = None, dictionary = None):
+        return format_sentences(self.find_example_sentences_by_word(word, limit, ranking, known, dictionary), translations)
 
     def load_sentence_rating_data(self, file):
-        with open(file, 'r') as file:
+        with diagnostics.load_timings.phase("sentences: read ratings") as phase, open(file, 'r', encoding='utf-8', newline='') as file:
             reader = csv.reader(file, delimiter='\t')
+            phase.items = 0
             for line in reader:
+                phase.items += 1
                 sentence = self.get_sentence_by_id(line[1])
                 if sentence:
                     if line[2] == '1':
@@ -47,53 +381,237 @@ class JapaneseSentenceLib:
                         sentence.add_negative_rating()
 
     def get_sentence_by_id(self, id):
-        if int(id) in self.sentences:
-            return self.sentences[int(id)]
+        position = self.position_of(int(id))
+        if position >= 0:
+            return Sentence(self, position)
         return None
 
-    def save_pickle_file(self, data_file):
-        with open(data_file, 'wb') as file:
-            pickle.dump(self.sentences, file)
+    def save_data_file(self, data_file):
+        if self.index is None:
+            self.build_index()
+        with diagnostics.load_timings.phase("sentences: save") as phase:
+            datafile.write_datafile(data_file, DATA_VERSION, {
+                "ids": self.ids,
+                "added": self.added,
+                "modified": self.modified,
+                "total": self.total,
+                "positive": self.positive,
+                "negative": self.negative,
+                "score": self.score,
+                "text_offsets": self.text_offsets,
+                "text": self.text,
+                "trans_offsets": self.translation_offsets,
+                "trans": self.translations,
+                "gram_keys": self.index.keys,
+                "gram_offsets": self.index.offsets,
+                "gram_postings": self.index.postings,
+                **self.word_sections,
+            })
+            phase.items = len(self.ids)
+
+    def load_data_file(self, data_file):
+        with diagnostics.load_timings.phase("sentences: load") as phase:
+            data = datafile.DataFile(data_file)
+            if data.version != DATA_VERSION:
+                version = data.version
+                data.close()
+                raise datafile.DataFileError(f"{data_file} is version {version}, expected {DATA_VERSION}")
+            self.data = data
+            self.ids = data.array("ids", 'I')
+            self.added = data.array("added", 'q')
+            self.modified = data.array("modified", 'q')
+            self.total = data.array("total", 'I')
+            self.positive = data.array("positive", 'I')
+            self.negative = data.array("negative", 'I')
+            self.score = data.array("score", 'd')
+            self.text_offsets = data.array("text_offsets", 'I')
+            self.text = data.section("text")
+            self.translation_offsets = data.array("trans_offsets", 'I')
+            self.translations = data.section("trans")
+            self.index = sentence_index.BigramIndex(data.array("gram_keys", 'Q'), data.array("gram_offsets", 'I'), data.array("gram_postings", 'I'))
+            # Only there when the dictionary was available at build time
+            if WORD_TABLE + ".keys" in data:
+                self.words = jmdict_index.KeyTable(data, WORD_TABLE)
+                self.sentence_word_offsets = data.array("sword_offs", 'I')
+                self.sentence_words = data.array("sword_keys", 'I')
+            phase.items = len(self.ids)
+
+    def close(self):
+        if self.data is not None:
+            self.index.release()
+            self.index = None
+            if self.words is not None:
+                self.words.release()
+                self.words = None
+                self.sentence_word_offsets.release()
+                self.sentence_words.release()
+                self.sentence_word_offsets = self.sentence_words = None
+            for column in (self.ids, self.added, self.modified, self.total, self.positive, self.negative, self.score, self.text_offsets, self.text, self.translation_offsets, self.translations):
+                column.release()
+            self.data.close()
+            self.data = None
+
+# Gives out example sentences for a whole batch of notes at once, so the same few sentences
+# don't end up on every card. Notes are added with their word, then allocate() hands out up to
+# limit sentences per note from its best limit * ALLOCATOR_CANDIDATES_PER_SENTENCE matches.
+# Works with either sentence backend.
+#
+# A greedy pass takes the cheapest (note, candidate) pair off a heap, its cost being the
+# candidate's place in the note's list plus REUSE_PENALTY for every note the sentence has gone to
+# since. Costs only go up, so instead of updating the heap a popped pair whose sentence has been
+# given out since it was pushed goes back in with its new cost. The penalty stops growing once
+# it's past the end of the candidate lists, which keeps those re-pushes to a few per pair.
+class SentenceAllocator:
+    def __init__(self, lib, limit, ranking = RANK_BY_DATE, known = None, dictionary = None):
+        self.lib = lib
+        self.limit = limit
+        self.ranking = ranking
+        self.known = known
+        self.dictionary = dictionary
+        self.keys = []
+        self.candidates = []
+        self.candidate_ids = []
+        self.found = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    # key identifies the note, e.g. its id. Notes with the same word share the lookup.
+    def add(self, key, word):
+        found = self.found.get(word)
+        if found is None:
+            candidates = self.lib.find_example_sentences_by_word(word, self.limit * ALLOCATOR_CANDIDATES_PER_SENTENCE, self.ranking, self.known, self.dictionary)
+            found = self.found[word] = (candidates, [sentence.id for sentence in candidates])
+        self.keys.append(key)
+        self.candidates.append(found[0])
+        self.candidate_ids.append(found[1])
+
+    # Returns {key: sentences} for the notes that got any, each note's in its own ranking order
+    def allocate(self):
+        max_uses = -(-self.limit * ALLOCATOR_CANDIDATES_PER_SENTENCE // REUSE_PENALTY)
+        uses = collections.Counter()
+        heap = [(place, note, place, 0)
+                for note, candidates in enumerate(self.candidates)
+                for place in range(len(candidates))]
+        heapq.heapify(heap)
+        chosen = [[] for _ in self.keys]
+        while heap:
+            cost, note, place, seen = heapq.heappop(heap)
+            if len(chosen[note]) >= self.limit:
+                continue
+            sentence_id = self.candidate_ids[note][place]
+            used = min(uses[sentence_id], max_uses)
+            if used != seen:
+                heapq.heappush(heap, (place + REUSE_PENALTY * used, note, place, used))
+                continue
+            chosen[note].append(place)
+            uses[sentence_id] += 1
+        return {self.keys[note]: [self.candidates[note][place] for place in sorted(places)]
+                for note, places in enumerate(chosen) if places}
+
+# The dictionary used by _segment_texts, opened once per process
+_dictionary = None
 
-    def load_pickle_file(self, data_file):
-        with open(data_file, 'rb') as file:
-            self.sentences = pickle.load(file)
+def _open_dictionary(dictionary_path):
+    global _dictionary
+    _dictionary = jmdict_index.JMdictIndex(dictionary_path)
 
+def _close_dictionary():
+    global _dictionary
+    _dictionary.close()
+    _dictionary = None
+
+# Runs in a worker process (or in this one when building serially): the distinct dictionary
+# forms of the words in each text
+def _segment_texts(texts):
+    return [list(dict.fromkeys(piece.term for piece in segmenter.words(_dictionary, text))) for text in texts]
+
+# The sentences for a note field, with translations each one is followed by its translation when it has one
+def format_sentences(sentences, translations = False):
+    output_str_ary = []
+    for sentence in sentences:
+        translation = sentence.translation if translations else ""
+        if translation:
+            output_str_ary.append(sentence.text + TRANSLATION_SEPARATOR + translation)
+        else:
+            output_str_ary.append(sentence.text)
+    return "<br>".join(output_str_ary)
+
+# Fixes up the ones without an added date, returns (added, modified) timestamps
+def fix_dates(date_added, date_modified):
+    if date_added == '\\N':
+        date_added = date_modified
+    if date_modified == '\\N':
+        date_modified = date_added
+    if date_added in ['0000-00-00 00:00:00', '\\N']:
+        date_added = DEFAULT_DATE
+    if date_modified in ['0000-00-00 00:00:00', '\\N']:
+        date_modified = DEFAULT_DATE
+    return parse_date(date_added), parse_date(date_modified)
+
+# A view of one sentence in a JapaneseSentenceLib, read straight from its columns
 class Sentence:
-    def __init__(self, data):
-        self.id = data[0]
-        self.lang = data[1]
-        self.text = data[2]
-        self.username = data[3]
-        self.date_added = data[4]
-        self.date_modified = data[5]
-        # Fixes up the ones without an added date
-        if self.date_added == '\\N':
-            self.date_added = self.date_modified
-        if self.date_modified == '\\N':
-            self.date_modified = self.date_added
-        if self.date_added in ['0000-00-00 00:00:00', '\\N']:
-            self.date_added = '2008-01-26 18:04:24'
-        if self.date_modified in ['0000-00-00 00:00:00', '\\N']:
-            self.date_modified = '2008-01-26 18:04:24'
-        self.date_modified = datetime.strptime(self.date_modified, '%Y-%m-%d %H:%M:%S')
-        self.date_added = datetime.strptime(self.date_added, '%Y-%m-%d %H:%M:%S')
-        self.total_ratings = 0
-        self.positive_rating = 0
-        self.negative_rating = 0
+    __slots__ = ("lib", "position")
+
+    def __init__(self, lib, position):
+        self.lib = lib
+        self.position = position
+
+    @property
+    def id(self):
+        return str(self.lib.ids[self.position])
+
+    @property
+    def text(self):
+        return self.lib.text_at(self.position)
+
+    @property
+    def translation(self):
+        return self.lib.translation_at(self.position)
+
+    @property
+    def date_added(self):
+        return to_datetime(self.lib.added[self.position])
+
+    @property
+    def date_modified(self):
+        return to_datetime(self.lib.modified[self.position])
+
+    @property
+    def total_ratings(self):
+        return self.lib.total[self.position]
+
+    @property
+    def positive_rating(self):
+        return self.lib.positive[self.position]
+
+    @property
+    def negative_rating(self):
+        return self.lib.negative[self.position]
+
+    @property
+    def score(self):
+        return self.lib.score[self.position]
 
     def add_positive_rating(self):
-        self.positive_rating = self.positive_rating + 1
-        self.total_ratings = self.total_ratings + 1
+        self.lib.positive[self.position] += 1
+        self.lib.total[self.position] += 1
 
     def add_undecided_rating(self):
-        self.total_ratings = self.total_ratings + 1
+        self.lib.total[self.position] += 1
 
     def add_negative_rating(self):
-        self.negative_rating = self.negative_rating + 1
-        self.total_ratings = self.total_ratings + 1
+        self.lib.negative[self.position] += 1
+        self.lib.total[self.position] += 1
 
     def get_rating_percentage(self):
         if self.total_ratings == 0:
             return 100
         return self.positive_rating / self.total_ratings * 100
+
+    # Static ranking score, lower is better
+    def compute_score(self):
+        rating = 1 - self.get_rating_percentage() / 100
+        length = min(abs(len(self.text) - SCORE_IDEAL_LENGTH) / SCORE_IDEAL_LENGTH, 1)
+        age = min(max((self.date_added - SCORE_FIRST_DATE).total_seconds() / SCORE_DATE_SPAN, 0), 1)
+        return SCORE_RATING_WEIGHT * rating + SCORE_LENGTH_WEIGHT * length + SCORE_DATE_WEIGHT * age
@@ -0,0 +1,95 @@
+import bisect
+from array import array
+
+# Inverted index from character bigrams to the sentences containing them.
+# Every character is indexed on its own too, so one character words can be looked up.
+# A query takes the grams of the word, intersects their posting lists starting from the
+# shortest and leaves the caller to check the few remaining candidates really contain the word.
+
+# A gram is packed into one integer: the first character's code point shifted past the
+# largest code point, then the second one's (0 for a single character, which never
+# occurs in text).
+CODE_POINT_BITS = 21
+
+def gram_key(first, second=None):
+    return (ord(first) << CODE_POINT_BITS) | (ord(second) if second else 0)
+
+def text_grams(text):
+    grams = {gram_key(char) for char in text}
+    grams.update(gram_key(text[i], text[i + 1]) for i in range(len(text) - 1))
+    return grams
+
+# The grams a word has to match, its bigrams or the character itself
+def query_grams(word):
+    if len(word) == 1:
+        return [gram_key(word)]
+    return list({gram_key(word[i], word[i + 1]) for i in range(len(word) - 1)})
+
+def _contains(postings, sentence_id):
+    position = bisect.bisect_left(postings, sentence_id)
+    return position < len(postings) and postings[position] == sentence_id
+
+class BigramIndex:
+    # keys: sorted gram keys, offsets: where each key's postings start in postings
+    # (len(keys) + 1 of them), postings: sentence ids (or positions), sorted within each key.
+    # Either arrays or memoryviews of a mapped file.
+    def __init__(self, keys, offsets, postings):
+        self.keys = keys
+        self.offsets = offsets
+        self.postings = postings
+        self.postings_view = memoryview(postings)
+
+    def __len__(self):
+        return len(self.keys)
+
+    # items are (sentence id, text) pairs
+    @classmethod
+    def build(cls, items):
+        grams = {}
+        for sentence_id, text in items:
+            for key in text_grams(text):
+                grams.setdefault(key, []).append(sentence_id)
+        keys = array('Q', sorted(grams))
+        offsets = array('I', [0])
+        postings = array('I')
+        for key in keys:
+            postings.extend(sorted(grams[key]))
+            offsets.append(len(postings))
+        return cls(keys, offsets, postings)
+
+    # Lets go of the arrays, needed before a memory mapped file can be closed
+    def release(self):
+        self.postings_view.release()
+        for column in (self.keys, self.offsets, self.postings):
+            if isinstance(column, memoryview):
+                column.release()
+
+    def postings_for(self, key):
+        position = bisect.bisect_left(self.keys, key)
+        if position == len(self.keys) or self.keys[position] != key:
+            return None
+        return self.postings_view[self.offsets[position]:self.offsets[position + 1]]
+
+    # Ids of the sentences that have every gram of word, in id order.
+    # A superset of the sentences containing word, check the text to be sure.
+    def candidates(self, word):
+        if not word:
+            return []
+        lists = []
+        for key in query_grams(word):
+            postings = self.postings_for(key)
+            if postings is None:
+                return []
+            lists.append(postings)
+        lists.sort(key=len)
+        result = lists[0].tolist()
+        for postings in lists[1:]:
+            if len(postings) > len(result) * 16:
+                # Much longer list, binary search it for each remaining candidate
+                result = [sentence_id for sentence_id in result if _contains(postings, sentence_id)]
+            else:
+                keep = set(postings)
+                result = [sentence_id for sentence_id in result if sentence_id in keep]
+            if not result:
+                break
+        return result